@@ -0,0 +1,132 @@
+import re
+import logging
+from utils import PHONE_PATTERN, normalize_text
+from config import COMPANY_CANDIDATES_TOP_K
+
+logger = logging.getLogger(__name__)
+
+# Адрес в подвале страницы товара начинается с населенного пункта
+ADDRESS_START_PATTERN = r"(г\.|город|пос\.|пгт|деревня|село)[^+]{10,1000}"
+
+# Все, что после этих слов, — описание проезда, а не адрес ("проезд" здесь нет: это тип улицы)
+STOP_WORDS = [
+    "въезд", "подъезд", "выезд", "переезд", "объезд", "приезд",
+    "въезжая", "выезжающий", "объезжающий", "проезжающий", "переезжающий"
+]
+
+POSTAL_INDEX_PATTERN = r"(?<!\d)\d{6}(?!\d)"
+
+# Служебные слова адреса: тип объекта не влияет на сравнение, значимы только названия и номера
+ADDRESS_WORDS = {
+    "г", "гор", "город", "обл", "область", "край", "респ", "республика", "р", "н", "р-н", "район", "рн",
+    "пос", "поселок", "п", "пгт", "д", "дер", "деревня", "с", "село", "ул", "улица", "пр", "пр-т", "проспект",
+    "пер", "переулок", "ш", "шоссе", "наб", "набережная", "б-р", "бульвар", "пл", "площадь", "проезд",
+    "тер", "территория", "мкр", "микрорайон", "дом", "стр", "строение", "к", "корп", "корпус", "лит", "литера",
+    "оф", "офис", "кв", "пом", "помещение", "россия", "рф", "российская", "федерация",
+}
+
+# Слова, после которых (или перед которыми) в части адреса стоит населенный пункт или регион
+LOCALITY_WORDS = {
+    "г", "гор", "город", "пос", "поселок", "п", "пгт", "дер", "деревня", "с", "село",
+    "обл", "область", "край", "респ", "республика", "р-н", "район", "рн",
+}
+# Части адреса разделяются запятыми, а также перед типом улицы ("г. Москва ул. Ленина")
+ADDRESS_PART_PATTERN = re.compile(
+    r",|(?=(?<![а-яё])(?:ул|улица|пр-т|проспект|пер|переулок|ш|шоссе|наб|набережная|б-р|бульвар|пл|площадь|проезд|мкр|микрорайон)(?![а-яё]))",
+    re.IGNORECASE
+)
+
+# Распространенные сокращения и варианты написания крупных городов
+ADDRESS_SYNONYMS = {
+    "спб": "санкт петербург",
+    "питер": "санкт петербург",
+    "мск": "москва",
+    "екб": "екатеринбург",
+    "нск": "новосибирск",
+}
+
+def extract_seller_address(raw_address: str) -> str:
+    """Вырезает адрес склада из текста подвала: от населенного пункта до телефона или описания проезда"""
+    try:
+        phone_match = re.search(PHONE_PATTERN, raw_address)
+        address_part = raw_address[:phone_match.start()] if phone_match else raw_address
+
+        match = re.search(ADDRESS_START_PATTERN, address_part, flags=re.IGNORECASE)
+        if not match:
+            return ""
+        address = re.sub(r"[\s,;]+$", "", match.group(0).strip())
+        for word in STOP_WORDS:
+            address = re.sub(rf"\b{word}\b.*", "", address, flags=re.IGNORECASE | re.DOTALL)
+        address = re.sub(r"[\s,;]+$", "", address)
+        return address if address.strip() else "не найдено"
+    except Exception:
+        return "не найдено"
+
+def address_tokens(address: str):
+    """Почтовый индекс и значимые слова адреса (названия, номера домов) без служебных сокращений"""
+    address = address or ""
+    index_match = re.search(POSTAL_INDEX_PATTERN, address)
+    postal_index = index_match.group(0) if index_match else None
+    text = re.sub(POSTAL_INDEX_PATTERN, " ", address)
+    # "д.5" и "ул.Ленина" разделяем, чтобы сокращение и значение стали отдельными словами
+    text = re.sub(r"\.", ". ", text)
+    tokens = set()
+    for token in normalize_text(text).split():
+        for word in ADDRESS_SYNONYMS.get(token, token).split():
+            if word not in ADDRESS_WORDS:
+                tokens.add(word)
+    return postal_index, tokens
+
+def locality_tokens(address: str):
+    """Слова населенного пункта и региона: части адреса с "г.", "обл." и т.п. без номеров"""
+    tokens = set()
+    for part in ADDRESS_PART_PATTERN.split(address or ""):
+        _, part_tokens = address_tokens(part)
+        words = set(normalize_text(re.sub(r"\.", ". ", part)).split())
+        if words & LOCALITY_WORDS:
+            tokens |= {token for token in part_tokens if not any(ch.isdigit() for ch in token)}
+    return tokens
+
+def address_similarity(address: str, candidate_address: str) -> float:
+    """Доля значимых слов адреса продавца, найденных в адресе из DaData; совпавший индекс добавляет вес.
+
+    Без совпавшей улицы — 0: в одном городе много юрлиц, а номер дома
+    без улицы ничего не говорит.
+    """
+    postal_index, tokens = address_tokens(address)
+    candidate_index, candidate_tokens = address_tokens(candidate_address)
+    if not tokens:
+        return 0.0
+    common = tokens & candidate_tokens
+    street_words = {token for token in common - locality_tokens(address) if not token.isdigit()}
+    if not street_words:
+        return 0.0
+    score = len(common) / len(tokens)
+    if postal_index and postal_index == candidate_index:
+        score += 0.5
+    return score
+
+def _candidate_address(item) -> str:
+    return ((item.get("data") or {}).get("address") or {}).get("value", "")
+
+def _is_active(item) -> bool:
+    return ((item.get("data") or {}).get("state") or {}).get("status") == "ACTIVE"
+
+def rank_candidates(suggestions, address, top_k=COMPANY_CANDIDATES_TOP_K):
+    """Подсказки DaData без повторов ИНН/КПП, от ближайшего по адресу к дальнему.
+
+    При равной близости выше действующие компании, затем исходный порядок DaData,
+    поэтому выбор детерминирован.
+    """
+    unique = {}
+    for item in suggestions:
+        data = item.get("data") or {}
+        unique.setdefault((data.get("inn"), data.get("kpp")), item)
+
+    has_address = address and address != "не найдено"
+    scored = [
+        (address_similarity(address, _candidate_address(item)) if has_address else 0.0, _is_active(item), -position, item)
+        for position, item in enumerate(unique.values())
+    ]
+    scored.sort(key=lambda entry: entry[:3], reverse=True)
+    return [(score, item) for score, _, _, item in scored[:top_k]]
@@ -1,19 +1,22 @@
 import json
 import re
 import logging
-import httpx
-import requests
 import asyncio
-from openai import AsyncOpenAI
-from config import PERPLEXITY_API_KEY, OPENAI_API_KEY, DADATA_HEADERS, COMPANIES_FILE, REQUEST_DELAY
+from config import (
+    PERPLEXITY_API_KEY, DADATA_HEADERS, DADATA_RATE_LIMIT, DADATA_TIMEOUT,
+    MATCH_CACHE_TTL_DAYS, MATCH_CACHE_MAX_ENTRIES, COMPANY_NAME_CACHE_TTL_DAYS, DADATA_CACHE_TTL_DAYS,
+    COMPANY_CACHE_MAX_ENTRIES, PERPLEXITY_CACHE_TTL_DAYS, PERPLEXITY_CACHE_MAX_ENTRIES, PERPLEXITY_EXCLUDE_DOMAINS_LIMIT
+)
+from cache import SqliteCache
+from utils import normalize_text, url_domain, AsyncRateLimiter
+from product_rules import check_product_rules
+from http_clients import http_clients
+from perplexity_parser import parse_perplexity_cards, to_card, CardStream
 
 logger = logging.getLogger(__name__)
 
-# Инициализация OpenAI клиента
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-async def perplexity_raw_search(material_name: str, count=3, attempt=1, exclude_urls=None) -> str:
-    """Поиск товаров через Perplexity API"""
+def perplexity_request(material_name: str, count=3, attempt=1, exclude_urls=None):
+    """URL, заголовки и тело запроса поиска товаров к Perplexity API"""
     url = "https://api.perplexity.ai/chat/completions"
     headers = {
         "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
@@ -79,10 +82,11 @@ async def perplexity_raw_search(material_name: str, count=3, attempt=1, exclude_
     
     # Добавляем исключения недоступных URL если они есть
     if exclude_urls and len(exclude_urls) > 0:
-        excluded_domains = list(set([url.split('/')[2] if url.startswith('http') else url for url in exclude_urls]))
+        # Порядок сохраняется: сначала недоступные в этом поиске, затем известные по истории
+        excluded_domains = list(dict.fromkeys(url_domain(url) for url in exclude_urls))
         
         prompt += f"\n\nВАЖНО: НЕ используй эти недоступные домены из предыдущих попыток:\n"
-        prompt += f"Исключить домены: {', '.join(excluded_domains[:10])}\n"  # Показываем первые 10
+        prompt += f"Исключить домены: {', '.join(excluded_domains[:PERPLEXITY_EXCLUDE_DOMAINS_LIMIT])}\n"
         prompt += f"Ищи товары на ДРУГИХ сайтах, которых нет в списке исключений!"
     payload = {
         "model": "sonar-pro",
@@ -92,10 +96,35 @@ async def perplexity_raw_search(material_name: str, count=3, attempt=1, exclude_
         ],
         "max_tokens": 2000
     }
-    async with httpx.AsyncClient(timeout=60) as client_httpx:
-        response = await client_httpx.post(url, headers=headers, json=payload)
+    return url, headers, payload
+
+async def perplexity_raw_search(material_name: str, count=3, attempt=1, exclude_urls=None) -> str:
+    """Поиск товаров через Perplexity API"""
+    url, headers, payload = perplexity_request(material_name, count, attempt, exclude_urls)
+    response = await http_clients.httpx.post(url, headers=headers, json=payload, timeout=60)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+async def perplexity_stream_search(material_name: str, count=3, attempt=1, exclude_urls=None):
+    """Поиск товаров через Perplexity API с потоковым ответом: отдает куски текста по мере генерации"""
+    url, headers, payload = perplexity_request(material_name, count, attempt, exclude_urls)
+    payload["stream"] = True
+    async with http_clients.httpx.stream("POST", url, headers=headers, json=payload, timeout=60) as response:
         response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            choices = chunk.get("choices") or []
+            delta = (choices[0].get("delta") or {}).get("content") if choices else None
+            if delta:
+                yield delta
 
 async def openai_to_json(raw_text: str, count: int = 3) -> list:
     """Конвертирует текст в JSON через OpenAI"""
@@ -125,7 +154,7 @@ async def openai_to_json(raw_text: str, count: int = 3) -> list:
         "Текст:\n"
         f"{raw_text}"
     )
-    response = await openai_client.chat.completions.create(
+    response = await http_clients.openai.chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
@@ -142,24 +171,93 @@ async def openai_to_json(raw_text: str, count: int = 3) -> list:
             raise RuntimeError(f"OpenAI не вернул валидный JSON. Ответ: {content}")
     return data
 
-async def perplexity_search_product_cards(material_name: str, count=3, attempt=1, exclude_urls=None):
-    """Получает сырые карточки из Perplexity, структурирует в JSON через OpenAI"""
+# Карточки Perplexity по материалу и варианту поиска: повторные строки и перезапуски не платят за поиск снова
+perplexity_cache = SqliteCache("perplexity", PERPLEXITY_CACHE_TTL_DAYS * 86400, PERPLEXITY_CACHE_MAX_ENTRIES)
+
+def perplexity_cache_key(material_name: str, count: int, attempt: int) -> str:
+    return f"{count}\t{attempt}\t{normalize_text(material_name)}"
+
+async def _cached_cards(cache_key: str, material_name: str, attempt: int, exclude_urls):
+    """Кэшированные карточки без исключенных доменов или None"""
+    cached = await asyncio.to_thread(perplexity_cache.get, cache_key)
+    if cached is None:
+        return None
+    excluded = {url_domain(url) for url in exclude_urls or []}
+    results = [item for item in cached if url_domain(item["url"]) not in excluded]
+    logger.info(f"[PERPLEXITY] Из кэша: '{material_name}', попытка {attempt} ({len(results)} из {len(cached)} карточек)")
+    return results
+
+async def perplexity_search_product_cards(material_name: str, count=3, attempt=1, exclude_urls=None, refresh=False):
+    """Получает сырые карточки из Perplexity и разбирает их (через OpenAI, если формат не распознан).
+
+    Карточки кэшируются по названию материала и номеру попытки (варианту поиска);
+    из кэшированных отбрасываются исключенные домены. refresh=True — искать заново.
+    """
+    cache_key = perplexity_cache_key(material_name, count, attempt)
+    cached = None if refresh else await _cached_cards(cache_key, material_name, attempt, exclude_urls)
+    if cached is not None:
+        return cached
+
     raw_text = await perplexity_raw_search(material_name, count, attempt, exclude_urls)
-    products = await openai_to_json(raw_text, count=count)
-    results = []
-    for item in products[:count]:
-        results.append({
-            "company": item.get("company", ""),
-            "url": item.get("url", ""),
-            "name": item.get("name", ""),
-            "price": item.get("price", ""),
-            "address": item.get("address", ""),
-            "phone": item.get("phone", ""),
-        })
+    # Ответ в заданном промптом формате разбирается локально, модель — только если формат нарушен
+    products = parse_perplexity_cards(raw_text, count=count)
+    if products is None:
+        products = await openai_to_json(raw_text, count=count)
+    else:
+        logger.info(f"[PERPLEXITY] Разобрано без GPT: {len(products)} карточек")
+    results = [to_card(item) for item in products[:count]]
+    if results:
+        await asyncio.to_thread(perplexity_cache.set, cache_key, results)
     return results
 
+async def perplexity_stream_product_cards(material_name: str, count=3, attempt=1, exclude_urls=None, refresh=False):
+    """Как perplexity_search_product_cards, но отдает карточки по одной, как только блок карточки получен целиком.
+
+    Если в ответе не нашлось ни одной карточки заданного формата, весь текст
+    разбирается через OpenAI. В кэш попадает только полностью полученный ответ.
+    """
+    cache_key = perplexity_cache_key(material_name, count, attempt)
+    cached = None if refresh else await _cached_cards(cache_key, material_name, attempt, exclude_urls)
+    if cached is not None:
+        for item in cached:
+            yield item
+        return
+
+    stream = CardStream()
+    raw_parts = []
+    results = []
+    async for chunk in perplexity_stream_search(material_name, count, attempt, exclude_urls):
+        raw_parts.append(chunk)
+        for card in stream.feed(chunk):
+            if len(results) < count:
+                results.append(card)
+                logger.info(f"[PERPLEXITY-STREAM] Карточка получена до конца ответа: {card['company']} | {card['url']}")
+                yield card
+    for card in stream.close():
+        if len(results) < count:
+            results.append(card)
+            yield card
+
+    if not results:
+        products = await openai_to_json("".join(raw_parts), count=count)
+        for item in products[:count]:
+            results.append(to_card(item))
+            yield results[-1]
+    if results:
+        await asyncio.to_thread(perplexity_cache.set, cache_key, results)
+
+# Очищенные GPT названия компаний и подсказки DaData: продавцы повторяются от материала к материалу
+company_name_cache = SqliteCache("company_name", COMPANY_NAME_CACHE_TTL_DAYS * 86400, COMPANY_CACHE_MAX_ENTRIES)
+dadata_cache = SqliteCache("dadata", DADATA_CACHE_TTL_DAYS * 86400, COMPANY_CACHE_MAX_ENTRIES)
+dadata_rate_limiter = AsyncRateLimiter(DADATA_RATE_LIMIT)
+
 async def gpt_clean_company_name(client, company_name: str) -> str:
     """Очищает название компании от сокращений, географических суффиксов и т.д."""
+    cache_key = normalize_text(company_name)
+    cached = await asyncio.to_thread(company_name_cache.get, cache_key)
+    if cached is not None:
+        return cached
+
     prompt = f"""
     Очисти название компании от сокращений, географических суффиксов и лишних слов.
     Оставь только основное название компании.
@@ -185,6 +283,8 @@ async def gpt_clean_company_name(client, company_name: str) -> str:
     )
     
     cleaned_name = response.choices[0].message.content.strip()
+    if cleaned_name:
+        await asyncio.to_thread(company_name_cache.set, cache_key, cleaned_name)
     return cleaned_name
 
 async def gpt_correct_company_name(client, company_name: str) -> str:
@@ -223,45 +323,26 @@ async def gpt_correct_company_name(client, company_name: str) -> str:
     corrected_name = response.choices[0].message.content.strip()
     return corrected_name
 
-def find_company_dadata(company_name, count=100, file_path=COMPANIES_FILE, client=None):
-    """Поиск по DaData и запись всех результатов в файл без фильтрации"""
+async def find_company_dadata(query, count=100):
+    """Подсказки DaData по организациям, с кэшем по нормализованному запросу"""
+    cache_key = f"{count}\t{normalize_text(query)}"
+    cached = await asyncio.to_thread(dadata_cache.get, cache_key)
+    if cached is not None:
+        logger.info(f"[DADATA] Из кэша: '{query}' ({len(cached)} компаний)")
+        return cached
+
     url = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/party"
-    data = {"query": company_name, "count": count}
-    response = requests.post(url, headers=DADATA_HEADERS, json=data)
+    data = {"query": query, "count": count}
+    await dadata_rate_limiter.wait()
+    response = await http_clients.httpx.post(url, headers=DADATA_HEADERS, json=data, timeout=DADATA_TIMEOUT)
     logger.info(f"DaData status: {response.status_code}, response: {response.text[:300]}...")
     response.raise_for_status()
-    result = response.json()
-    suggestions = result.get("suggestions", [])
-
-    # Если не найдено ни одной компании, пробуем очистить название через GPT и повторить поиск
-    if not suggestions and client is not None:
-        logger.info(f"[DADATA] Не найдено по '{company_name}', пробуем очистить название через GPT...")
-        loop = asyncio.get_event_loop()
-        cleaned_name = loop.run_until_complete(gpt_clean_company_name(client, company_name))
-        logger.info(f"[DADATA] Очищенное название: '{cleaned_name}'")
-        data = {"query": cleaned_name, "count": count}
-        response = requests.post(url, headers=DADATA_HEADERS, json=data)
-        logger.info(f"DaData (повтор) status: {response.status_code}, response: {response.text[:300]}...")
-        response.raise_for_status()
-        result = response.json()
-        suggestions = result.get("suggestions", [])
-
-    with open(file_path, "a", encoding="utf-8") as f:
-        for item in suggestions:
-            state = item["data"].get("state", {})
-            status = state.get("status", "UNKNOWN")
-            f.write(f"Название: {item['value']}\n")
-            f.write(f"ИНН: {item['data'].get('inn', '')}\n")
-            f.write(f"КПП: {item['data'].get('kpp', '')}\n")
-            f.write(f"Адрес: {item['data'].get('address', {}).get('value', '')}\n")
-            f.write(f"Статус: {status}\n")
-            f.write('-' * 40 + '\n')
-    logger.info(f"Записано компаний: {len(suggestions)} в файл {file_path}")
+    suggestions = response.json().get("suggestions", [])
+    await asyncio.to_thread(dadata_cache.set, cache_key, suggestions)
     return suggestions
 
-async def gpt_check_product_match(query_name, product_name, company_name, found_companies, client):
-    """Проверяет соответствие товара запросу через GPT"""
-    prompt = ("Ты — эксперт по сравнению строительных материалов. "
+PRODUCT_MATCH_INTRO = (
+    "Ты — эксперт по сравнению строительных материалов. "
     "Твоя задача — отсеять карточки, которые НЕ являются нужным товаром.\n\n"
     "⚠️ Пропускай всё, где есть слова: \"услуга\", \"аренда\", \"освидетельствование\", "
     "\"проверка\", \"диагностика\", \"монтаж\", \"доставка\".\n"
@@ -270,7 +351,9 @@ async def gpt_check_product_match(query_name, product_name, company_name, found_
     "• материал, толщина, вид обработки совпадают,\n"
     "• название отражает именно продукт, а не работу/услугу.\n\n"
     "Правила сравнения:\n"
-    "Если название компании на сайте уже есть в списке найденных компаний, всегда отвечай 'нет'.\n"
+)
+
+PRODUCT_MATCH_RULES = (
     "1. Считай товары одинаковыми, если:\n"
     "   - Основной материал совпадает (например, 'хризотилцементный' = 'асбестоцементный')\n"
     "   - Тип изделия совпадает (например, 'лист' = 'шифер')\n"
@@ -293,11 +376,25 @@ async def gpt_check_product_match(query_name, product_name, company_name, found_
     "- 'Лист хризотилцементный плоский прессованный 8 мм' ≠ 'Лист хризотилцементный волнистый 8 мм'\n"
     "- 'Лист хризотилцементный плоский прессованный 8 мм' ≠ 'Лист хризотилцементный плоский непрессованный 8 мм'\n"
     "- 'Лист хризотилцементный плоский прессованный 8 мм' ≠ 'Лист хризотилцементный плоский прессованный 10 мм'\n\n"
-    f'Название из запроса: "{query_name}"\n'
-    f'Название на сайте: "{product_name}"\n'
-    f'Название компании на сайте: "{company_name}"\n'
-    f'Уже найденные компании: {found_companies}\n'
-    'Ответь строго одним словом: да или нет.'
+)
+
+# Решения о соответствии карточки запросу: ключ — нормализованные название запроса и карточки
+match_cache = SqliteCache("product_match", MATCH_CACHE_TTL_DAYS * 86400, MATCH_CACHE_MAX_ENTRIES)
+
+def match_cache_key(query_name, product_name):
+    return f"{normalize_text(query_name)}\t{normalize_text(product_name)}"
+
+async def gpt_check_product_match(query_name, product_name, company_name, found_companies, client):
+    """Проверяет соответствие товара запросу через GPT"""
+    prompt = (
+        PRODUCT_MATCH_INTRO +
+        "Если название компании на сайте уже есть в списке найденных компаний, всегда отвечай 'нет'.\n" +
+        PRODUCT_MATCH_RULES +
+        f'Название из запроса: "{query_name}"\n'
+        f'Название на сайте: "{product_name}"\n'
+        f'Название компании на сайте: "{company_name}"\n'
+        f'Уже найденные компании: {found_companies}\n'
+        'Ответь строго одним словом: да или нет.'
     )
     response = await client.chat.completions.create(
         model="gpt-4o",
@@ -307,6 +404,64 @@ async def gpt_check_product_match(query_name, product_name, company_name, found_
     )
     return response.choices[0].message.content.strip().lower()
 
+async def gpt_check_products_match_batch(query_name, cards, found_companies, client) -> list:
+    """Проверяет все карточки страницы одним запросом к GPT, возвращает "да"/"нет" по каждой"""
+    answers = ["нет"] * len(cards)
+    # Правило "компания уже найдена" проверяется локально, такие карточки в GPT не отправляются
+    pending = []
+    for idx, card in enumerate(cards):
+        if card["company"] in found_companies:
+            continue
+        # Явные несовпадения (услуги, толщина, прессованный/непрессованный) решаются без GPT
+        decided = check_product_rules(query_name, card["name"])
+        if decided is not None:
+            answers[idx] = decided
+            continue
+        cached = await asyncio.to_thread(match_cache.get, match_cache_key(query_name, card["name"]))
+        if cached is not None:
+            answers[idx] = cached
+        else:
+            pending.append(idx)
+    if len(pending) < len(cards):
+        logger.info(f"[GPT-BATCH] По правилам/из кэша/по компании решено {len(cards) - len(pending)} из {len(cards)} карточек")
+    if not pending:
+        return answers
+
+    cards_text = "\n".join(f'{num}. "{cards[idx]["name"]}"' for num, idx in enumerate(pending, 1))
+    prompt = (
+        PRODUCT_MATCH_INTRO +
+        PRODUCT_MATCH_RULES +
+        f'Название из запроса: "{query_name}"\n'
+        f'Названия карточек на сайте:\n{cards_text}\n\n'
+        f'Для каждой карточки ответь да или нет. Верни только JSON вида {{"answers": ["да", "нет", ...]}} '
+        f'— ровно {len(pending)} ответов в порядке карточек.'
+    )
+    try:
+        response = await client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=8 * len(pending) + 20,
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+        batch_answers = json.loads(response.choices[0].message.content)["answers"]
+        if len(batch_answers) != len(pending):
+            raise ValueError(f"ожидалось {len(pending)} ответов, получено {len(batch_answers)}")
+        for idx, answer in zip(pending, batch_answers):
+            answers[idx] = str(answer).strip().lower()
+    except Exception as e:
+        logger.warning(f"[GPT-BATCH] Пакетная проверка не удалась ({e}), проверяем карточки по одной")
+        single_answers = await asyncio.gather(*(
+            gpt_check_product_match(query_name, cards[idx]["name"], cards[idx]["company"], list(found_companies), client)
+            for idx in pending
+        ))
+        for idx, answer in zip(pending, single_answers):
+            answers[idx] = answer
+    for idx in pending:
+        if answers[idx] in ("да", "нет"):
+            await asyncio.to_thread(match_cache.set, match_cache_key(query_name, cards[idx]["name"]), answers[idx])
+    return answers
+
 def extract_text_from_image(image_path):
     """Извлекает текст из изображения с помощью OCR"""
     try:
@@ -331,7 +486,7 @@ async def gpt_extract_data_from_screenshot(text):
         f"{text}\n\n"
         "Верни только JSON:"
     )
-    response = await openai_client.chat.completions.create(
+    response = await http_clients.openai.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
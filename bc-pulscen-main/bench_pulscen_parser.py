@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import argparse
+from playwright.async_api import async_playwright
+from pulscen_parser import extract_product_page
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pulscen_product_page.html")
+
+async def legacy_product_page(page) -> dict:
+    """Прежний разбор страницы товара из main.py: отдельный запрос к браузеру на каждый элемент.
+
+    Селекторы и обработка ошибок скопированы без изменений, включая 'a, span, text()'.
+    """
+    characteristics = {}
+    try:
+        char_block = await page.query_selector('div.product-tabber__body.js-product-tabber-content')
+        if char_block:
+            items = await char_block.query_selector_all('div.product-description-list__item')
+            for item in items:
+                label_elem = await item.query_selector('span.product-description-list__label')
+                value_elem = await item.query_selector('span.product-description-list__value')
+                if label_elem and value_elem:
+                    label = (await label_elem.inner_text()).strip()
+                    value_texts = []
+                    for node in await value_elem.query_selector_all('a, span, text()'):
+                        try:
+                            txt = await node.inner_text()
+                            if txt:
+                                value_texts.append(txt.strip())
+                        except Exception:
+                            pass
+                    if not value_texts:
+                        value_texts = [(await value_elem.inner_text()).strip()]
+                    value = ", ".join(value_texts)
+                    characteristics[label] = value
+
+        try:
+            descr_block = await page.query_selector('div.product-tabber__body.js-product-tabber-content#tab-description div.product-description.js-apb-descr')
+            if descr_block:
+                paragraphs = await descr_block.query_selector_all('p')
+                description_texts = []
+                for p in paragraphs:
+                    txt = await p.inner_text()
+                    if txt:
+                        description_texts.append(txt.strip())
+                description = ' '.join(description_texts)
+                words = description.split()
+                if len(words) > 70:
+                    description = ' '.join(words[:70]) + '...'
+                characteristics['Описание'] = description
+        except Exception:
+            pass
+    except Exception:
+        pass
+
+    try:
+        delivery_elem = await page.query_selector("div.product-deliveries__name")
+        delivery_method = await delivery_elem.inner_text() if delivery_elem else ""
+        if isinstance(delivery_method, str):
+            delivery_method = delivery_method.replace('\n', ' ').strip()
+    except Exception:
+        delivery_method = ""
+    address_elem = await page.query_selector("div.footer-bottom__address")
+    footer_address = await address_elem.inner_text() if address_elem else ""
+    try:
+        seller_site_elem = await page.query_selector("a.js-ykr-action")
+        seller_site = await seller_site_elem.get_attribute("href") if seller_site_elem else ""
+    except Exception:
+        seller_site = ""
+    return {
+        "characteristics": characteristics,
+        "delivery_method": delivery_method,
+        "footer_address": footer_address,
+        "seller_site": seller_site or ""
+    }
+
+async def timed(func, page, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        await func(page)
+    return (time.perf_counter() - started) / runs * 1000
+
+async def main(runs):
+    with open(FIXTURE, encoding="utf-8") as f:
+        html = f.read()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(html)
+
+        # Совпадение результата с прежним разбором проверяет pulscen_parser_test.py (без браузера);
+        # здесь только сравнивается время
+        legacy = await legacy_product_page(page)
+        print(f"Прежний разбор: {len(legacy['characteristics'])} полей характеристик")
+
+        legacy_ms = await timed(legacy_product_page, page, runs)
+        single_ms = await timed(extract_product_page, page, runs)
+        print(f"Поэлементный разбор: {legacy_ms:.1f} мс")
+        print(f"Один page.evaluate:  {single_ms:.1f} мс")
+        print(f"Ускорение: x{legacy_ms / single_ms:.1f}")
+        await browser.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение разбора страницы товара Pulscen на фикстуре")
+    parser.add_argument("--runs", type=int, default=20)
+    asyncio.run(main(parser.parse_args().runs))
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from config import (
+    BROWSER_USER_AGENT, BROWSER_VIEWPORT, BROWSER_ARGS, BROWSER_HEADLESS,
+    BROWSER_POOL_SIZE, BROWSER_MAX_PAGES, BROWSER_MEMORY_LIMIT_MB
+)
+
+logger = logging.getLogger(__name__)
+
+def browser_memory_mb():
+    """Суммарная память (RSS, МБ) процессов Chromium, запущенных этим процессом"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    total = 0
+    for proc in psutil.Process().children(recursive=True):
+        try:
+            if "chrom" in proc.name().lower():
+                total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return round(total / (1024 * 1024), 1)
+
+class BrowserPool:
+    """Долгоживущий Chromium, из которого каждому запросу выдается новый контекст.
+
+    Контекст создается на время запроса и закрывается после него, поэтому cookies,
+    localStorage, IndexedDB, service workers и HTTP-кэш не переходят между заданиями.
+    Дорогой сам Chromium: он перезапускается, только когда его память превышает
+    порог или открыто слишком много страниц. Новые запросы сразу получают контексты
+    нового браузера, старый закрывается после освобождения своих контекстов.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES,
+                 memory_limit_mb=BROWSER_MEMORY_LIMIT_MB, headless=BROWSER_HEADLESS):
+        self.size = size
+        self.max_pages = max_pages
+        self.memory_limit_mb = memory_limit_mb
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._open_contexts = {}  # Браузер → число выданных из него контекстов
+        self._pages_opened = 0  # Страниц, открытых в текущем браузере
+        self._relaunch_reason = None
+        self._semaphore = asyncio.Semaphore(size)
+        self._lock = asyncio.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._leases_total = 0
+        self._relaunched_total = 0
+        self._wait_total = 0.0
+
+    @property
+    def started(self):
+        return self._playwright is not None
+
+    async def start(self):
+        """Запускает Playwright и Chromium (вызывается при старте приложения)"""
+        if self.started:
+            return
+        self._playwright = await async_playwright().start()
+        await self._launch_browser()
+        logger.info(f"[POOL] Пул браузеров запущен: size={self.size}, max_pages={self.max_pages}, headless={self.headless}")
+
+    async def stop(self):
+        """Закрывает все браузеры и Playwright"""
+        try:
+            for browser in list(self._open_contexts):
+                await self._close_browser(browser)
+            if self._playwright:
+                await self._playwright.stop()
+        except Exception as e:
+            logger.error(f"[POOL] Ошибка при остановке пула: {e}")
+        finally:
+            self._browser = None
+            self._open_contexts = {}
+            self._playwright = None
+        logger.info("[POOL] Пул браузеров остановлен")
+
+    async def _launch_browser(self):
+        self._browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            args=BROWSER_ARGS
+        )
+        self._open_contexts[self._browser] = 0
+        self._pages_opened = 0
+        if not self.headless:
+            # Позиционируем окно браузера в левом верхнем углу (macOS)
+            try:
+                subprocess.run(['osascript', '-e', 'tell application "System Events" to set position of first window of application process "Chromium" to {0, 0}'],
+                               capture_output=True, check=False)
+            except Exception as e:
+                logger.debug(f"Не удалось позиционировать окно браузера: {e}")
+
+    async def _close_browser(self, browser):
+        self._open_contexts.pop(browser, None)
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.warning(f"[POOL] Ошибка при закрытии браузера: {e}")
+
+    def _on_page(self, page):
+        self._pages_opened += 1
+
+    async def _acquire_context(self):
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                logger.warning("[POOL] Браузер недоступен, перезапускаем Chromium")
+                if self._browser is not None:
+                    await self._close_browser(self._browser)
+                await self._launch_browser()
+            elif self._relaunch_reason:
+                logger.info(f"[POOL] Перезапускаем Chromium ({self._relaunch_reason})")
+                old_browser = self._browser
+                self._relaunch_reason = None
+                self._relaunched_total += 1
+                await self._launch_browser()
+                # Старый браузер закрывается, когда вернут все его контексты
+                if not self._open_contexts.get(old_browser):
+                    await self._close_browser(old_browser)
+            browser = self._browser
+            context = await browser.new_context(
+                user_agent=BROWSER_USER_AGENT,
+                viewport=BROWSER_VIEWPORT
+            )
+            context.on("page", self._on_page)
+            self._open_contexts[browser] += 1
+            return browser, context
+
+    def _relaunch_check(self):
+        if self._pages_opened >= self.max_pages:
+            return f"открыто страниц: {self._pages_opened}"
+        memory = browser_memory_mb()
+        if memory is not None and memory >= self.memory_limit_mb:
+            return f"память Chromium {memory} МБ"
+        return None
+
+    async def _release(self, browser, context):
+        try:
+            await context.close()
+        except Exception as e:
+            logger.warning(f"[POOL] Контекст не удалось закрыть: {e}")
+        async with self._lock:
+            if browser in self._open_contexts:
+                self._open_contexts[browser] -= 1
+                if browser is not self._browser and self._open_contexts[browser] == 0:
+                    await self._close_browser(browser)
+            if browser is self._browser and not self._relaunch_reason:
+                self._relaunch_reason = self._relaunch_check()
+
+    @asynccontextmanager
+    async def lease(self):
+        """Выдает новый контекст браузера в монопольное пользование на время запроса"""
+        if not self.started:
+            raise RuntimeError("Пул браузеров не запущен")
+        wait_started = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            browser, context = await self._acquire_context()
+        except Exception:
+            self._semaphore.release()
+            raise
+        self._wait_total += time.monotonic() - wait_started
+        self._leases_total += 1
+        self._in_use += 1
+        try:
+            yield context
+        finally:
+            self._in_use -= 1
+            await self._release(browser, context)
+            self._semaphore.release()
+
+    def stats(self):
+        """Заполненность пула для подбора его размера"""
+        return {
+            "size": self.size,
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "leases_total": self._leases_total,
+            "browser_relaunched_total": self._relaunched_total,
+            "browsers_open": len(self._open_contexts),
+            "pages_opened": self._pages_opened,
+            "avg_wait_ms": round(self._wait_total / self._leases_total * 1000, 1) if self._leases_total else 0.0,
+            "browser_connected": bool(self._browser and self._browser.is_connected()),
+            "memory_mb": browser_memory_mb()
+        }
+
+browser_pool = BrowserPool()
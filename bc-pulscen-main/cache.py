@@ -0,0 +1,117 @@
+import json
+import time
+import logging
+from config import CACHE_DB_FILE
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class SqliteCache(SqliteStore):
+    """Персистентный кэш ключ-значение в SQLite с TTL и вытеснением давно не использованных записей.
+
+    Несколько кэшей делят один файл, каждый в своем пространстве имен.
+    Счетчики попаданий хранятся в базе, поэтому учитывают и API, и воркеры.
+    """
+
+    SCHEMA = CACHE_SCHEMA
+
+    def __init__(self, namespace: str, ttl: float, max_entries: int, path=CACHE_DB_FILE):
+        super().__init__(path)
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)", (namespace,))
+
+    def _count(self, conn, field):
+        conn.execute(f"UPDATE cache_stats SET {field} = {field} + 1 WHERE namespace = ?", (self.namespace,))
+
+    def get(self, key: str, default=None):
+        """Возвращает значение по ключу или default, если записи нет или она устарела"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._count(conn, "misses")
+                return default
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            self._count(conn, "hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        """Сохраняет значение; при превышении max_entries вытесняет самые давно использованные записи"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            overflow = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                    (self.namespace, self.namespace, overflow)
+                )
+                conn.execute(
+                    "UPDATE cache_stats SET evictions = evictions + ? WHERE namespace = ?",
+                    (overflow, self.namespace)
+                )
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self) -> int:
+        """Удаляет все записи пространства имен, возвращает их количество"""
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,)).rowcount
+        logger.info(f"[CACHE] {self.namespace}: удалено записей {removed}")
+        return removed
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+            hits, misses, evictions = conn.execute(
+                "SELECT hits, misses, evictions FROM cache_stats WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_days": round(self.ttl / 86400, 1),
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,49 @@
+from decimal import Decimal
+from price_parser import parse_price, normalize_unit
+from formula_engine import build_formula, extract_coefficients
+
+def check_parse_price():
+    assert parse_price("1 200", "руб./шт.")["unit"] == "шт"
+    assert parse_price("350", "руб./м2")["unit"] == "м2"
+    assert parse_price("12 000 руб./м3 (с НДС 20%)")["unit"] == "м3"
+    assert parse_price("12 000 руб./м3 (с НДС 20%)")["min"] == Decimal("12000")
+    assert parse_price("480 руб/м²")["unit"] == "м2"
+    assert parse_price("450 руб/ 1 шт")["unit"] == "шт"
+    assert parse_price("100 руб./1000 шт")["unit"] is None  # цена за партию, а не за штуку
+    assert parse_price("900 руб./кв.м")["unit"] == "м2"
+    assert parse_price("5 600 руб./куб. м")["unit"] == "м3"
+    assert parse_price("85 руб./пог.м")["unit"] == "м"
+    assert parse_price("от 1 200 до 1 500", "руб./т")["max"] == Decimal("1500")
+    # Размер партии или упаковки после цены не принимается за диапазон цен
+    lot = parse_price("от 100 руб./шт. (партия 1-5 шт)")
+    assert (lot["min"], lot["max"], lot["unit"]) == (Decimal("100"), Decimal("100"), "шт")
+    pack = parse_price("10 руб/шт, упаковка 100-200 шт")
+    assert (pack["min"], pack["max"], pack["unit"]) == (Decimal("10"), Decimal("10"), "шт")
+    assert parse_price("1 500 руб., партия 20 шт/упак")["unit"] is None
+    packed = parse_price("260 руб./мешок 30 кг")
+    assert (packed["unit"], packed["pack_size"], packed["pack_unit"]) == ("упак", Decimal("30"), "кг")
+    assert parse_price("цена по запросу") is None
+    assert normalize_unit("м³") == "м3"
+
+def check_build_formula():
+    def formula(price, currency, target_unit, material_name):
+        return build_formula({"price": price, "currency": currency}, target_unit, material_name)
+
+    # Цена за м²/м³ не выдается за цену за погонный метр, одинаковые единицы не уходят в GPT
+    assert formula("350", "руб./м2", "м", "Профнастил С8") is None
+    assert formula("12 000", "руб./м3", "м", "Бетон М300") is None
+    assert formula("480", "руб/м²", "м3", "Утеплитель") is None
+    assert formula("350", "руб./м2", "м2", "Профнастил С8") == "ƒ = м² в м² = ( 350*1 ) = 350.00 руб./м²"
+    assert formula("12 000", "руб./м3", "м3", "Бетон М300") == "ƒ = м³ в м³ = ( 12000*1 ) = 12000.00 руб./м³"
+    assert formula("260", "руб./мешок 30 кг", "т", "Мел МТД-2") == "ƒ = упак в т = ( 260*(1000/30) ) = 8666.67 руб./т"
+
+    # Газобетон и сухие смеси — не газы
+    assert not extract_coefficients("Газобетон D500 600х300х200").get("is_gas")
+    assert not extract_coefficients("Сухая смесь штукатурная 25 кг").get("is_gas")
+    assert extract_coefficients("Кислород газообразный технический").get("gas_k") == Decimal("0.84")
+    assert extract_coefficients("Газ сварочный (смесь аргона и углекислого газа)").get("is_gas")
+
+if __name__ == "__main__":
+    check_parse_price()
+    check_build_formula()
+    print("Проверки разбора цен и формул пройдены")
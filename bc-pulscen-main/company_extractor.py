@@ -2,80 +2,106 @@ import json
 import logging
 import asyncio
 from ai_services import gpt_clean_company_name, gpt_correct_company_name, find_company_dadata
-from utils import read_formula_table, read_comp_table
-from config import REQUEST_DELAY, COMPANIES_FILE
+from utils import normalize_text, is_valid_inn, find_email
+from address_matcher import rank_candidates
+from formula_engine import build_formula
+from formula_table import formula_table
+from price_parser import parse_price, normalize_unit
+from cache import SqliteCache
+from config import COMPANY_IDENTITY_CACHE_TTL_DAYS, COMPANY_CACHE_MAX_ENTRIES, ADDRESS_MATCH_MIN_SCORE
 
 logger = logging.getLogger(__name__)
 
-async def extract_company_data(
-    page_text: str, extracted_address: str, target_unit: str, product_url: str,
-    phone_number: str, company_name: str, material_name: str, price_info: str, kg: str,
-    characteristics: dict = None, description: str = None, client=None
-) -> dict:
-    """Извлекает данные о компании с помощью AI"""
-    logger.info("extract_company_data ВЫЗВАНА!!!")
+# Продавец (нормализованное название с Pulscen) → название, ИНН и КПП из DaData
+company_identity_cache = SqliteCache("company_identity", COMPANY_IDENTITY_CACHE_TTL_DAYS * 86400, COMPANY_CACHE_MAX_ENTRIES)
+
+# Подсказок DaData в записи кэша продавца: для выбора по адресу хватает первых по релевантности
+IDENTITY_SUGGESTIONS_LIMIT = 30
+
+def compact_suggestion(item):
+    """Подсказка DaData только с полями, которые нужны для выбора компании по адресу"""
+    data = item.get("data") or {}
+    return {
+        "value": item.get("value", ""),
+        "data": {
+            "inn": data.get("inn"),
+            "kpp": data.get("kpp"),
+            "address": {"value": (data.get("address") or {}).get("value", "")},
+            "state": {"status": (data.get("state") or {}).get("status")},
+        },
+    }
+
+def pick_company(suggestions):
+    """Первая подсказка DaData с корректным ИНН, предпочтительно с полным названием"""
+    valid = [item for item in suggestions if is_valid_inn(item.get("data", {}).get("inn"))]
+    for item in valid:
+        value = item.get("value", "")
+        if value and not value.startswith(("ООО", "АО", "ЗАО", "ОАО")):
+            return item
+    return valid[0] if valid else None
+
+async def _lookup_variant(variant: str, name_coro):
+    name = await name_coro
+    logger.info(f"[COMPANY] Вариант названия ({variant}): {name}")
+    suggestions = await find_company_dadata(name, count=100)
+    return name, suggestions
+
+async def resolve_company(company_name: str, client):
+    """Находит название, ИНН и КПП продавца через GPT и DaData.
+
+    Повторные продавцы берутся из кэша целиком, вместе с подсказками DaData, без запросов в сеть.
+    """
+    identity_key = normalize_text(company_name)
+    identity = await asyncio.to_thread(company_identity_cache.get, identity_key)
+    if identity is not None and "suggestions" in identity:
+        logger.info(f"[COMPANY] Из кэша: {company_name} → {identity['company_n']} (ИНН: {identity['inn']})")
+        return identity["company_n"], identity["inn"], identity["kpp"], identity["suggestions"]
+
+    # Оригинальное название (сразу в DaData, без GPT), очищенное и скорректированное GPT ищутся
+    # одновременно; первый вариант, давший компанию с корректным ИНН, отменяет остальные вместе
+    # с еще не завершенными запросами к GPT
+    tasks = [
+        asyncio.create_task(_lookup_variant("оригинальное", asyncio.sleep(0, result=company_name))),
+        asyncio.create_task(_lookup_variant("очищенное", gpt_clean_company_name(client, company_name))),
+        asyncio.create_task(_lookup_variant("скорректированное", gpt_correct_company_name(client, company_name))),
+    ]
+    all_suggestions = []
     try:
-        if not client or not client.api_key:
-            logger.error("OPENAI_API_KEY не установлен!")
-            raise ValueError("Отсутствует OPENAI_API_KEY")
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                query, suggestions = await next_done
+            except Exception as e:
+                logger.warning(f"[COMPANY] Вариант поиска для '{company_name}' не удался: {e}")
+                continue
+            chosen = pick_company(suggestions)
+            if chosen is not None:
+                data = chosen.get("data", {})
+                company_n = chosen.get("value") or "не найдено"
+                inn = data["inn"]
+                kpp = data.get("kpp") or "не найдено"
+                logger.info(f"[COMPANY] Найдено по названию '{query}': {company_n} (ИНН: {inn})")
+                await asyncio.to_thread(company_identity_cache.set, identity_key, {
+                    "company_n": company_n, "inn": inn, "kpp": kpp, "query": query,
+                    "suggestions": [compact_suggestion(item) for item in suggestions[:IDENTITY_SUGGESTIONS_LIMIT]],
+                })
+                return company_n, inn, kpp, suggestions
+            all_suggestions.extend(suggestions)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-        await asyncio.sleep(REQUEST_DELAY)
-
-        # Очищаем название компании перед поиском
-        cleaned_company_name = await gpt_clean_company_name(client, company_name)
-        logger.info(f"[COMPANY] Оригинальное название: {company_name}")
-        logger.info(f"[COMPANY] Очищенное название: {cleaned_company_name}")
-
-        # Поиск по DaData с очищенным названием
-        suggestions = find_company_dadata(cleaned_company_name, count=100, client=client)
-        
-        # Если не нашли по очищенному названию, пробуем оригинальное
-        if not suggestions:
-            logger.info("[COMPANY] Не найдено по очищенному названию, пробуем оригинальное")
-            suggestions = find_company_dadata(company_name, count=100, client=client)
-
-        # Если нашли компании, берем первую с полным названием
-        company_n = "не найдено"
-        inn = "не найдено"
-        kpp = "не найдено"
-        if suggestions:
-            for suggestion in suggestions:
-                value = suggestion.get("value", "")
-                data = suggestion.get("data", {})
-                if value and not value.startswith(("ООО", "АО", "ЗАО", "ОАО")):
-                    company_n = value
-                    inn = data.get("inn", "не найдено")
-                    kpp = data.get("kpp", "не найдено")
-                    break
-            if company_n == "не найдено":
-                company_n = suggestions[0].get("value", "не найдено")
-                inn = suggestions[0].get("data", {}).get("inn", "не найдено")
-                kpp = suggestions[0].get("data", {}).get("kpp", "не найдено")
-
-        # Если ИНН не найден, пробуем еще раз с GPT-скорректированным названием
-        if inn == "не найдено":
-            logger.info("[COMPANY] ИНН не найден, пробуем скорректировать название через GPT")
-            corrected_name = await gpt_correct_company_name(client, company_name)
-            logger.info(f"[COMPANY] Скорректированное название: {corrected_name}")
-            
-            # Пробуем поиск с новым названием
-            new_suggestions = find_company_dadata(corrected_name, count=100, client=client)
-            if new_suggestions:
-                for suggestion in new_suggestions:
-                    value = suggestion.get("value", "")
-                    data = suggestion.get("data", {})
-                    if value and data.get("inn"):
-                        company_n = value
-                        inn = data.get("inn", "не найдено")
-                        kpp = data.get("kpp", "не найдено")
-                        logger.info(f"[COMPANY] Найдено по скорректированному названию: {company_n} (ИНН: {inn})")
-                        break
-
-        formula_table = read_formula_table()
-        comp = read_comp_table()
-
-        # Промпт для расчёта формулы
-        formula_prompt = f'''
+    logger.info(f"[COMPANY] ИНН для '{company_name}' не найден ни по одному варианту названия")
+    return "не найдено", "не найдено", "не найдено", all_suggestions
+
+async def gpt_calculate_formula(client, material_name, price_info, target_unit, characteristics, description) -> str:
+    """Просит GPT вывести формулу пересчета цены, когда локальный расчет не нашел коэффициент"""
+    # В промпт идут только правила для единицы цены и целевой единицы
+    parsed_price = parse_price(price_info.get("price"), price_info.get("currency"))
+    rules = formula_table.rules_for(parsed_price["unit"] if parsed_price else None, normalize_unit(target_unit))
+
+    # Промпт для расчёта формулы
+    formula_prompt = f'''
 Ты — калькулятор строительных цен.
 Шаги:
 
@@ -91,27 +117,7 @@ async def extract_company_data(
 5. Если данных нет → «не найдено», формулу не выводи.
 
 Таблица правил:
-{formula_table}
-• КГ → Т: *1000
-• Т → КГ: /1000
-• ШТ → М² (лист/рулон/картон/паронит): /<S, м²>
-• ШТ → М³ (лист по толщине): /(S * h)
-• ШТ → КГ (канистра N кг): *N
-• ШТ → м (пог.м): /<L, м>
-• УПАК → КГ: /<масса, кг>
-• УПАК → Т: *<масса, кг> /1000
-• Л → М³ (жидкости): /1000
-• Л → КГ (жидкости): *<ρ, кг/л>
-• КГ → Л (жидкости): /<ρ>
-• Л → М³ (ГАЗЫ, БАЛЛОНЫ чистые): *k  
-  k: He 0.74  O₂ 0.84  CH₄ 0.71  C₃H₈ 0.51
-• Баллон V м³ → М³: /V
-• КГ → М² (мастики, битумная гидроизоляция): /(q, кг/м²)
-• Т → М³ (битум / эмульсия): /(ρ, т/м³)
-• Если название плитка 1000х1500х3000 мм 240 руб и нужно в м3 -> 240 / (1 * 1.5 * 3) = 53.33 руб./м³. Если указан объем например 0.38 м³, то цена будет 240 / 0.38 = 631.58 руб./м3
-
-• Если цена указана за мешок (N кг), чтобы получить цену за тонну, умножь цену за мешок на (1000 / N).
-  Пример: 260 руб./мешок 30 кг → 260 * (1000 / 30) = 8 666 руб./т
+{rules}
 
 Правила МЕТА  
 1) Нет коэффициента — «не найдено».  
@@ -119,47 +125,76 @@ async def extract_company_data(
 3) Итог строго «… руб./<цел-ед.>».
 '''
 
-        prompt = f"""
+    prompt = f"""
 {formula_prompt}
 
-Вот содержимое страницы товара:
-
-Ссылка: {product_url}
-
-Задание:
-• Найди и укажи ТОЛЬКО ТО, что явно подтверждено в поиске и на странице!
-• Извлеки:
-    - Название компании: {company_n} (используй это название, оно уже проверено через DaData)
-    — Email компании (если явно указан)
-    — ИНН и КПП у {company_name}, ищи в документе {comp}, сравнивай его с адресом {extracted_address}. Если не найдешь такой же адрес или он не найден то бери первый результат и вставь ИНН/КПП с его адресом, чтобы он был там. Пример: если стоит "kpp":"123","kpp_largest":null то тебе нужно извлекать kpp а не kpp_largest т.е. где есть данные
-    — Адрес компании: {extracted_address} (или бери из ИНН/КПП адрес документа comp, если не нашел)
-    — Телефон компании: {phone_number} (или в документе comp указан, если не нашел)
-    — Цена: {price_info}
-    — Целевая единица измерения: {target_unit}
-    — Название материала: {material_name} и {kg}
-
 Верни только JSON:
 {{
-    "company_n": "{company_n}",
-    "email": "...",
-    "inn": "{inn}",
-    "kpp": "{kpp}",
-    "address": "...",
-    "phone": "...",
     "formula": "..."
 }}
 """
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            response_format={"type": "json_object"}
-        )
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        response_format={"type": "json_object"}
+    )
+
+    if hasattr(response, "usage"):
+        logger.info(f"Токенов prompt: {response.usage.prompt_tokens}, completion: {response.usage.completion_tokens}, total: {response.usage.total_tokens}")
+    return json.loads(response.choices[0].message.content).get("formula", "не указан")
+
+async def extract_company_data(
+    page_text: str, extracted_address: str, target_unit: str, product_url: str,
+    phone_number: str, company_name: str, material_name: str, price_info: str, kg: str,
+    characteristics: dict = None, description: str = None, client=None
+) -> dict:
+    """Извлекает данные о компании с помощью AI"""
+    logger.info("extract_company_data ВЫЗВАНА!!!")
+    try:
+        if not client or not client.api_key:
+            logger.error("OPENAI_API_KEY не установлен!")
+            raise ValueError("Отсутствует OPENAI_API_KEY")
 
-        if hasattr(response, "usage"):
-            logger.info(f"Токенов prompt: {response.usage.prompt_tokens}, completion: {response.usage.completion_tokens}, total: {response.usage.total_tokens}")
+        company_n, inn, kpp, suggestions = await resolve_company(company_name, client)
+
+        # ИНН/КПП берутся из подсказки DaData, ближайшей по адресу к адресу продавца;
+        # если совпал только город или адрес не совпал, остается компания, найденная по названию
+        ranked = rank_candidates(suggestions, extracted_address)
+        for score, item in ranked:
+            logger.info(f"[COMPANY] Кандидат {item.get('value')} (ИНН {item['data'].get('inn')}, КПП {item['data'].get('kpp')}): близость адреса {score:.2f}")
+        if ranked and ranked[0][0] >= ADDRESS_MATCH_MIN_SCORE:
+            chosen = ranked[0][1]
+        else:
+            chosen = next((item for item in suggestions if item.get("data", {}).get("inn") == inn), None)
+        chosen_address = ""
+        if chosen is not None:
+            data = chosen.get("data", {})
+            company_n = chosen.get("value") or company_n
+            inn = data.get("inn") or inn
+            kpp = data.get("kpp") or "не найдено"
+            chosen_address = (data.get("address") or {}).get("value", "")
+        elif company_n == "не найдено" and suggestions:
+            company_n = suggestions[0].get("value", "не найдено")
+
+        has_address = extracted_address and extracted_address != "не найдено"
+        result = {
+            "company_n": company_n,
+            "email": find_email(page_text) or "не найдено",
+            "inn": inn,
+            "kpp": kpp,
+            "phone": phone_number or "не найдено",
+            "address": extracted_address if has_address else (chosen_address or "не найдено"),
+        }
+
+        # Формула считается локально, GPT нужен только если не хватает коэффициента
+        formula = build_formula(price_info, target_unit, material_name, characteristics, description)
+        if formula:
+            logger.info(f"[FORMULA] Рассчитано локально: {formula}")
+        else:
+            formula = await gpt_calculate_formula(client, material_name, price_info, target_unit, characteristics, description)
+        result["formula"] = formula
 
-        result = json.loads(response.choices[0].message.content)
         for field in ["company_n", "email", "inn", "kpp", "phone", "address", "formula"]:
             value = result.get(field, "не указан")
             if value == "не найдено":
@@ -169,10 +204,6 @@ async def extract_company_data(
             else:
                 logger.info(f"[{field}] — найдено: {value}")
 
-        # Если company_n не найден, но DaData вернула хотя бы одну компанию, подставить её название
-        if (result.get("company_n", "не найдено") in ["не найдено", "не указан"]) and suggestions:
-            result["company_n"] = suggestions[0]["value"]
-
         return {
             "company_n": result.get("company_n", "не указан"),
             "email": result.get("email", "не указан"),
@@ -188,10 +219,6 @@ async def extract_company_data(
     except Exception as e:
         logger.error(f"Ошибка: {str(e)}")
         return default_response()
-    finally:
-        # Очистить файл comp после использования
-        with open(COMPANIES_FILE, "w", encoding="utf-8") as f:
-            f.truncate(0)
 
 def default_response():
     """Возвращает ответ по умолчанию"""
@@ -16,11 +16,9 @@ DADATA_HEADERS = {
 }
 
 # Файлы
-COMPANIES_FILE = "companies.txt"
 FORMULA_FILE = "формула.txt"
 
 # Настройки
-REQUEST_DELAY = 7
 MAX_PAGE_TEXT_LENGTH = 3500
 
 # Настройки браузера
@@ -33,10 +31,71 @@ BROWSER_ARGS = [
     '--window-position=0,0'    # Позиция окна (левый верхний угол)
 ]
 
+# Скриншоты: "playwright" — снимок страницы без окна, "pyautogui" — снимок всего экрана (нужен дисплей)
+SCREENSHOT_MODE = os.getenv("SCREENSHOT_MODE", "playwright")
+BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "false" if SCREENSHOT_MODE == "pyautogui" else "true").lower() == "true"
+
+# Пул браузеров
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "3"))  # Максимум одновременно выданных контекстов
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "500"))  # После стольких страниц Chromium перезапускается
+BROWSER_MEMORY_LIMIT_MB = int(os.getenv("BROWSER_MEMORY_LIMIT_MB", "2048"))  # Порог памяти Chromium для перезапуска
+
+# Параллельная обработка
+CARD_CONCURRENCY = int(os.getenv("CARD_CONCURRENCY", "3"))  # Карточек одной строки в работе одновременно
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(BROWSER_POOL_SIZE)))  # Строк пакета в работе одновременно
+
+# Очередь заданий
+JOBS_DB_FILE = os.getenv("JOBS_DB_FILE", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Процессов-воркеров по умолчанию
+JOB_POLL_INTERVAL = 2  # Пауза воркера при пустой очереди, с
+JOB_HEARTBEAT_INTERVAL = 15  # Как часто воркер отмечается в задании, с
+JOB_STALE_AFTER = 120  # Без отметки дольше этого задание считается брошенным, с
+JOB_MAX_ATTEMPTS = 3  # Сколько раз брошенное задание возвращается в очередь
+
+# Кэш решений
+CACHE_DB_FILE = os.getenv("CACHE_DB_FILE", "cache.sqlite3")
+MATCH_CACHE_TTL_DAYS = int(os.getenv("MATCH_CACHE_TTL_DAYS", "180"))  # Решения "да"/"нет" переживают несколько кварталов
+MATCH_CACHE_MAX_ENTRIES = int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "50000"))
+COMPANY_NAME_CACHE_TTL_DAYS = int(os.getenv("COMPANY_NAME_CACHE_TTL_DAYS", "365"))  # Сырое название → очищенное GPT
+DADATA_CACHE_TTL_DAYS = int(os.getenv("DADATA_CACHE_TTL_DAYS", "30"))  # Запрос → подсказки DaData (статусы и адреса меняются)
+COMPANY_IDENTITY_CACHE_TTL_DAYS = int(os.getenv("COMPANY_IDENTITY_CACHE_TTL_DAYS", "90"))  # Продавец → название, ИНН, КПП
+COMPANY_CACHE_MAX_ENTRIES = int(os.getenv("COMPANY_CACHE_MAX_ENTRIES", "20000"))  # Для каждого из трех кэшей компаний
+PERPLEXITY_CACHE_TTL_DAYS = int(os.getenv("PERPLEXITY_CACHE_TTL_DAYS", "7"))  # Карточки Perplexity: цены и наличие устаревают быстро
+PERPLEXITY_CACHE_MAX_ENTRIES = int(os.getenv("PERPLEXITY_CACHE_MAX_ENTRIES", "5000"))
+
+# DaData
+DADATA_RATE_LIMIT = float(os.getenv("DADATA_RATE_LIMIT", "10"))  # Запросов в секунду на процесс
+DADATA_TIMEOUT = 10  # Таймаут запроса к DaData, с
+COMPANY_CANDIDATES_TOP_K = int(os.getenv("COMPANY_CANDIDATES_TOP_K", "5"))  # Сколько ближайших по адресу кандидатов DaData ранжируется и пишется в лог
+ADDRESS_MATCH_MIN_SCORE = 0.5  # Близость адреса, при которой кандидат DaData заменяет компанию, найденную по названию
+
+# Исходящие HTTP-запросы (общие пулы соединений)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))  # Соединений, которые держатся открытыми между запросами
+HTTP_KEEPALIVE_EXPIRY = 30  # Сколько простаивающее соединение остается в пуле, с
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))  # Одновременных соединений aiohttp к одному хосту
+HTTP_DNS_CACHE_TTL = 300  # Кэш DNS aiohttp, с
+
+# Поиск через Perplexity
+PERPLEXITY_MAX_ATTEMPTS = int(os.getenv("PERPLEXITY_MAX_ATTEMPTS", "10"))  # Бюджет: вариантов поиска на строку, пока не наберутся 3 карточки
+PERPLEXITY_PARALLEL_SEARCHES = int(os.getenv("PERPLEXITY_PARALLEL_SEARCHES", "1"))  # Вариантов поиска одновременно (1 — по очереди)
+PERPLEXITY_STREAM = os.getenv("PERPLEXITY_STREAM", "false").lower() == "true"  # Читать ответ потоком и проверять карточки сразу
+URL_VALIDATION_DEADLINE = int(os.getenv("URL_VALIDATION_DEADLINE", "30"))  # Срок проверки ссылок одной попытки, с
+PERPLEXITY_EXCLUDE_DOMAINS_LIMIT = 30  # Сколько исключенных доменов перечисляется в промпте
+
 # Таймауты
 PAGE_TIMEOUT = 90000
 SELLER_PAGE_TIMEOUT = 15000
 PRODUCT_PAGE_TIMEOUT = 60000
 
+# Реестр доменов: таймауты выше — верхняя граница, по истории домена они сокращаются
+DOMAIN_DEAD_AFTER = int(os.getenv("DOMAIN_DEAD_AFTER", "3"))  # Неудач подряд, после которых домен считается недоступным
+DOMAIN_DEAD_TTL_HOURS = int(os.getenv("DOMAIN_DEAD_TTL_HOURS", "24"))  # Через сколько часов недоступный домен проверяется снова
+DOMAIN_LATENCY_SAMPLES = 50  # Последних замеров загрузки на домен
+DOMAIN_MIN_SAMPLES = 5  # Замеров, после которых таймаут считается по истории
+DOMAIN_TIMEOUT_FACTOR = 3  # Таймаут = p95 времени загрузки × множитель
+DOMAIN_TIMEOUT_MIN = 5000  # Нижняя граница адаптивного таймаута, мс
+DOMAIN_REQUEST_RATE = float(os.getenv("DOMAIN_REQUEST_RATE", "1"))  # Загрузок страниц одного домена в секунду (0 — без ограничения)
+
 # Настройки поиска
 MAX_PAGES = 1 
\ No newline at end of file
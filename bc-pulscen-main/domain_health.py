@@ -0,0 +1,165 @@
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from config import (
+    CACHE_DB_FILE, DOMAIN_DEAD_AFTER, DOMAIN_DEAD_TTL_HOURS, DOMAIN_LATENCY_SAMPLES,
+    DOMAIN_MIN_SAMPLES, DOMAIN_TIMEOUT_FACTOR, DOMAIN_TIMEOUT_MIN, DOMAIN_REQUEST_RATE
+)
+from utils import url_domain, AsyncRateLimiter
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+HEALTH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS domain_health (
+    domain TEXT PRIMARY KEY,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    ssl_errors INTEGER NOT NULL DEFAULT 0,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    last_success_at REAL,
+    last_failure_at REAL
+);
+CREATE TABLE IF NOT EXISTS domain_latency (
+    domain TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    observed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS domain_latency_domain ON domain_latency (domain, observed_at);
+"""
+
+SSL_MARKERS = ("ssl", "certificate")
+
+def percentile(values, fraction):
+    """Значение, ниже которого лежит доля fraction отсортированных наблюдений"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class DomainHealth(SqliteStore):
+    """Реестр доменов: успехи, ошибки (в том числе SSL) и время загрузки страниц.
+
+    Хранится в SQLite и общий для API и воркеров, поэтому переживает перезапуски.
+    Домен с DOMAIN_DEAD_AFTER неудачами подряд считается недоступным, пока
+    последняя ошибка не старше DOMAIN_DEAD_TTL_HOURS.
+    """
+
+    SCHEMA = HEALTH_SCHEMA
+
+    def __init__(self, path=CACHE_DB_FILE, dead_after=DOMAIN_DEAD_AFTER, dead_ttl=DOMAIN_DEAD_TTL_HOURS * 3600,
+                 samples=DOMAIN_LATENCY_SAMPLES):
+        super().__init__(path)
+        self.dead_after = dead_after
+        self.dead_ttl = dead_ttl
+        self.samples = samples
+
+    def record_success(self, domain: str, seconds: float = None):
+        """Отмечает удачное обращение; seconds — время загрузки страницы"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO domain_health (domain) VALUES (?)", (domain,))
+            conn.execute(
+                "UPDATE domain_health SET successes = successes + 1, consecutive_failures = 0, last_success_at = ? "
+                "WHERE domain = ?",
+                (now, domain)
+            )
+            if seconds is not None:
+                conn.execute("INSERT INTO domain_latency (domain, seconds, observed_at) VALUES (?, ?, ?)", (domain, seconds, now))
+                conn.execute(
+                    "DELETE FROM domain_latency WHERE domain = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM domain_latency WHERE domain = ? ORDER BY observed_at DESC LIMIT ?)",
+                    (domain, domain, self.samples)
+                )
+
+    def record_failure(self, domain: str, error: str):
+        """Отмечает неудачное обращение; ошибки сертификатов считаются отдельно"""
+        is_ssl = any(marker in error.lower() for marker in SSL_MARKERS)
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO domain_health (domain) VALUES (?)", (domain,))
+            conn.execute(
+                "UPDATE domain_health SET failures = failures + 1, ssl_errors = ssl_errors + ?, "
+                "consecutive_failures = consecutive_failures + 1, last_error = ?, last_failure_at = ? WHERE domain = ?",
+                (int(is_ssl), error[:300], time.time(), domain)
+            )
+
+    def is_dead(self, domain: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM domain_health WHERE domain = ? AND consecutive_failures >= ? AND last_failure_at > ?",
+                (domain, self.dead_after, time.time() - self.dead_ttl)
+            ).fetchone()
+        return row is not None
+
+    def dead_domains(self) -> list:
+        """Недоступные сейчас домены, сначала с самой свежей ошибкой"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT domain FROM domain_health WHERE consecutive_failures >= ? AND last_failure_at > ? "
+                "ORDER BY last_failure_at DESC",
+                (self.dead_after, time.time() - self.dead_ttl)
+            ).fetchall()
+        return [row["domain"] for row in rows]
+
+    def latency(self, domain: str) -> dict:
+        """Число замеров и перцентили времени загрузки (p50, p95), с"""
+        with self._connect() as conn:
+            values = [row["seconds"] for row in conn.execute("SELECT seconds FROM domain_latency WHERE domain = ?", (domain,))]
+        if not values:
+            return {"samples": 0, "p50": None, "p95": None}
+        return {"samples": len(values), "p50": round(percentile(values, 0.5), 3), "p95": round(percentile(values, 0.95), 3)}
+
+    def timeout_for(self, domain: str, default_ms: int) -> int:
+        """Таймаут загрузки (мс) по истории домена: p95 с запасом, но не больше default_ms.
+
+        Без достаточной истории и после неудачи последнего обращения — default_ms,
+        чтобы слишком короткий таймаут не закреплял сам себя.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT consecutive_failures FROM domain_health WHERE domain = ?", (domain,)).fetchone()
+        if row is None or row["consecutive_failures"]:
+            return default_ms
+        latency = self.latency(domain)
+        if latency["samples"] < DOMAIN_MIN_SAMPLES:
+            return default_ms
+        return int(min(default_ms, max(DOMAIN_TIMEOUT_MIN, latency["p95"] * DOMAIN_TIMEOUT_FACTOR * 1000)))
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS domains, COALESCE(SUM(failures), 0) AS failures, COALESCE(SUM(ssl_errors), 0) AS ssl_errors "
+                "FROM domain_health"
+            ).fetchone()
+        dead = self.dead_domains()
+        return {
+            "domains": row["domains"],
+            "failures": row["failures"],
+            "ssl_errors": row["ssl_errors"],
+            "dead": len(dead),
+            "dead_domains": dead[:100],
+        }
+
+domain_health = DomainHealth()
+
+# Вежливость к сайтам: страницы одного домена загружаются не чаще DOMAIN_REQUEST_RATE в секунду
+domain_rate_limiters = defaultdict(lambda: AsyncRateLimiter(DOMAIN_REQUEST_RATE))
+
+async def timed_goto(page, url: str, timeout: int, **kwargs):
+    """page.goto с таймаутом по истории домена (timeout — верхняя граница, мс).
+
+    Загрузки страниц одного домена разносятся по времени (DOMAIN_REQUEST_RATE);
+    время загрузки и ошибки записываются в реестр доменов.
+    """
+    domain = url_domain(url)
+    adaptive_timeout = await asyncio.to_thread(domain_health.timeout_for, domain, timeout)
+    if adaptive_timeout != timeout:
+        logger.info(f"[DOMAIN] Таймаут для {domain}: {adaptive_timeout} мс вместо {timeout} мс")
+    await domain_rate_limiters[domain].wait()
+    started = time.monotonic()
+    try:
+        response = await page.goto(url, timeout=adaptive_timeout, **kwargs)
+    except Exception as e:
+        await asyncio.to_thread(domain_health.record_failure, domain, str(e))
+        raise
+    await asyncio.to_thread(domain_health.record_success, domain, time.monotonic() - started)
+    return response
@@ -0,0 +1,150 @@
+import re
+import logging
+from decimal import Decimal
+from price_parser import parse_price, normalize_unit, to_decimal
+
+logger = logging.getLogger(__name__)
+
+UNIT_LABELS = {"т": "т", "кг": "кг", "шт": "шт", "упак": "упак", "м2": "м²", "м3": "м³", "л": "л", "м": "м"}
+
+# Л → М³ для газов: в справочнике формул газы только умножаются на коэффициент
+GAS_COEFFICIENTS = {
+    "гели": Decimal("0.74"),
+    "кислород": Decimal("0.84"),
+    "метан": Decimal("0.71"),
+    "пропан": Decimal("0.51"),
+}
+# Газы ищутся целыми словами: "газобетон", "сухая смесь", "метанол" газами не являются
+GAS_PATTERN = re.compile(
+    r"(?<![а-я])(?:газ|газы|газа|газов|газом|газов(?:ый|ая|ое|ые|ых)|аргон\w*|азот|азота|азотом|углекислот\w*|углекисл(?:ый|ого) газ\w*"
+    r"|водород|водорода|ацетилен\w*|гели[йяюе]\w*|кислород|кислорода|метан|метана|пропан|пропана)(?![а-я])"
+)
+
+# Пересчет только между одинаковыми единицами длины, площади и объема; м ↔ м² ↔ м³ без размеров невозможен
+GEOMETRIC_UNITS = ("м", "м2", "м3")
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+MASS_PATTERN = re.compile(NUMBER + r"\s*(кг|тонн[аы]?|тн|т)(?![а-я/])")
+VOLUME_PATTERN = re.compile(NUMBER + r"\s*(?:м3|м³|куб\.?\s*м)")
+AREA_PATTERN = re.compile(NUMBER + r"\s*(?:м2|м²|кв\.?\s*м)")
+LITERS_PATTERN = re.compile(NUMBER + r"\s*(?:л|литр)(?![а-я])")
+LENGTH_PATTERN = re.compile(NUMBER + r"\s*(?:пог\.?\s*м|п\.?\s*м|м)(?![а-я0-9²³])")
+DIMENSIONS_PATTERN = re.compile(NUMBER + r"\s*[хx*×]\s*" + NUMBER + r"(?:\s*[хx*×]\s*" + NUMBER + r")?\s*(мм|см|м)?(?![а-я0-9²³])")
+
+LENGTH_TO_M = {"мм": Decimal("0.001"), "см": Decimal("0.01"), "м": Decimal("1")}
+
+def _fmt(value: Decimal) -> str:
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return text or "0"
+
+def extract_coefficients(material_name: str, characteristics: dict = None, description: str = None) -> dict:
+    """Ищет массу упаковки, объем, площадь, длину и размеры в названии, характеристиках и описании.
+
+    Название важнее характеристик, характеристики — описания: берется первое найденное значение.
+    """
+    sources = [material_name or ""]
+    sources += [f"{label}: {value}" for label, value in (characteristics or {}).items() if label != "Описание"]
+    sources.append(description or "")
+
+    found = {}
+    for source in sources:
+        text = source.lower().replace("ё", "е")
+        for key, pattern in (("volume_m3", VOLUME_PATTERN), ("area_m2", AREA_PATTERN), ("liters", LITERS_PATTERN)):
+            match = pattern.search(text)
+            if match and key not in found:
+                found[key] = to_decimal(match.group(1))
+        match = MASS_PATTERN.search(text)
+        if match and "mass_kg" not in found:
+            mass = to_decimal(match.group(1))
+            found["mass_kg"] = mass * 1000 if match.group(2) != "кг" else mass
+        match = DIMENSIONS_PATTERN.search(text)
+        if match and "dimensions_m" not in found:
+            scale = LENGTH_TO_M[match.group(4) or "мм"]
+            found["dimensions_m"] = [to_decimal(group) * scale for group in match.groups()[:3] if group]
+        match = LENGTH_PATTERN.search(re.sub(DIMENSIONS_PATTERN, " ", text))
+        if match and "length_m" not in found:
+            found["length_m"] = to_decimal(match.group(1))
+
+    material = (material_name or "").lower().replace("ё", "е")
+    found["is_gas"] = bool(GAS_PATTERN.search(material))
+    gases = [coefficient for stem, coefficient in GAS_COEFFICIENTS.items() if stem in material] if found["is_gas"] else []
+    if len(gases) == 1 and "смес" not in material:  # смеси газов считает модель
+        found["gas_k"] = gases[0]
+    return {key: value for key, value in found.items() if value}
+
+def _conversion(src, dst, coefficients):
+    """Операция и множитель для перевода цены из src в dst или None, если не хватает коэффициента"""
+    if src == dst:
+        return "*", "1", Decimal(1)
+    if src in GEOMETRIC_UNITS and dst in GEOMETRIC_UNITS:
+        return None
+    if (src, dst) == ("кг", "т"):
+        return "*", "1000", Decimal(1000)
+    if (src, dst) == ("т", "кг"):
+        return "/", "1000", Decimal(1000)
+    if (src, dst) == ("л", "м3"):
+        if "gas_k" in coefficients:
+            return "*", _fmt(coefficients["gas_k"]), coefficients["gas_k"]
+        if coefficients.get("is_gas"):
+            return None
+        return "*", "1000", Decimal(1000)
+    if (src, dst) == ("м3", "л"):
+        return "/", "1000", Decimal(1000)
+    if src not in ("шт", "упак"):
+        return None
+
+    mass = coefficients.get("mass_kg")
+    dims = coefficients.get("dimensions_m")
+    if dst == "кг" and mass:
+        return "/", _fmt(mass), mass
+    if dst == "т" and mass:
+        return "*", f"(1000/{_fmt(mass)})", Decimal(1000) / mass
+    if dst == "м2":
+        if "area_m2" in coefficients:
+            return "/", _fmt(coefficients["area_m2"]), coefficients["area_m2"]
+        if dims and len(dims) >= 2:
+            sides = sorted(dims)[-2:]
+            return "/", f"({_fmt(sides[0])}*{_fmt(sides[1])})", sides[0] * sides[1]
+    if dst == "м3":
+        if "volume_m3" in coefficients:
+            return "/", _fmt(coefficients["volume_m3"]), coefficients["volume_m3"]
+        if dims and len(dims) == 3:
+            return "/", "(" + "*".join(_fmt(side) for side in dims) + ")", dims[0] * dims[1] * dims[2]
+    if dst == "м" and "length_m" in coefficients:
+        return "/", _fmt(coefficients["length_m"]), coefficients["length_m"]
+    if dst == "л" and "liters" in coefficients:
+        return "/", _fmt(coefficients["liters"]), coefficients["liters"]
+    return None
+
+# Размер упаковки из строки цены ("руб./мешок 30 кг") точнее, чем найденный в описании
+PACK_COEFFICIENTS = {"кг": "mass_kg", "л": "liters", "м2": "area_m2", "м3": "volume_m3", "м": "length_m"}
+
+def build_formula(price_info: dict, target_unit: str, material_name: str,
+                  characteristics: dict = None, description: str = None):
+    """Считает цену в целевой единице и возвращает строку
+    "ƒ = <SRC> в <DST> = ( <PRICE><операция><FACTOR> ) = <ITOG> руб./<DST>" или None,
+    если единицу цены или нужный коэффициент определить не удалось.
+    """
+    parsed = parse_price(price_info.get("price"), price_info.get("currency"))
+    dst = normalize_unit(target_unit)
+    if parsed is None or parsed["unit"] is None or dst is None:
+        return None
+    price, src = parsed["min"], parsed["unit"]
+
+    coefficients = extract_coefficients(material_name, characteristics, description)
+    if parsed["pack_size"]:
+        if parsed["pack_unit"] == "т":
+            coefficients["mass_kg"] = parsed["pack_size"] * 1000
+        elif parsed["pack_unit"] in PACK_COEFFICIENTS:
+            coefficients[PACK_COEFFICIENTS[parsed["pack_unit"]]] = parsed["pack_size"]
+    conversion = _conversion(src, dst, coefficients)
+    if conversion is None:
+        logger.info(f"[FORMULA] Нет коэффициента для {src} → {dst} ({material_name})")
+        return None
+
+    operation, factor_text, factor = conversion
+    result = price * factor if operation == "*" else price / factor
+    return (
+        f"ƒ = {UNIT_LABELS[src]} в {UNIT_LABELS[dst]} = ( {_fmt(price)}{operation}{factor_text} ) "
+        f"= {result:.2f} руб./{UNIT_LABELS[dst]}"
+    )
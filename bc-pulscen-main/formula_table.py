@@ -0,0 +1,97 @@
+import os
+import re
+import logging
+from config import FORMULA_FILE
+
+logger = logging.getLogger(__name__)
+
+# Правила пересчета из промпта формулы: (исходная единица, целевая единица, текст)
+PROMPT_RULES = [
+    ("кг", "т", "• КГ → Т: *1000"),
+    ("т", "кг", "• Т → КГ: /1000"),
+    ("шт", "м2", "• ШТ → М² (лист/рулон/картон/паронит): /<S, м²>"),
+    ("шт", "м3", "• ШТ → М³ (лист по толщине): /(S * h)"),
+    ("шт", "кг", "• ШТ → КГ (канистра N кг): *N"),
+    ("шт", "м", "• ШТ → м (пог.м): /<L, м>"),
+    ("упак", "кг", "• УПАК → КГ: /<масса, кг>"),
+    ("упак", "т", "• УПАК → Т: *<масса, кг> /1000"),
+    ("л", "м3", "• Л → М³ (жидкости): /1000"),
+    ("л", "кг", "• Л → КГ (жидкости): *<ρ, кг/л>"),
+    ("кг", "л", "• КГ → Л (жидкости): /<ρ>"),
+    ("л", "м3", "• Л → М³ (ГАЗЫ, БАЛЛОНЫ чистые): *k  \n  k: He 0.74  O₂ 0.84  CH₄ 0.71  C₃H₈ 0.51"),
+    ("шт", "м3", "• Баллон V м³ → М³: /V"),
+    ("кг", "м2", "• КГ → М² (мастики, битумная гидроизоляция): /(q, кг/м²)"),
+    ("т", "м3", "• Т → М³ (битум / эмульсия): /(ρ, т/м³)"),
+    ("шт", "м3", "• Если название плитка 1000х1500х3000 мм 240 руб и нужно в м3 -> 240 / (1 * 1.5 * 3) = 53.33 руб./м³. "
+                 "Если указан объем например 0.38 м³, то цена будет 240 / 0.38 = 631.58 руб./м3"),
+    ("упак", "т", "• Если цена указана за мешок (N кг), чтобы получить цену за тонну, умножь цену за мешок на (1000 / N).\n"
+                  "  Пример: 260 руб./мешок 30 кг → 260 * (1000 / 30) = 8 666 руб./т"),
+]
+
+# По каким словам строка справочника относится к единице измерения
+UNIT_MARKERS = {
+    "м3": r"м³|м3|куб",
+    "м2": r"м²|м2|кв\.?\s?м|площад",
+    "л": r"(?<![а-я])л(?![а-я])|литр|жидк",
+    "кг": r"кг|масс",
+    "т": r"(?<![а-я])т(?![а-я])|тонн|u_t",
+    "шт": r"(?<![а-я])шт|лист|штук|блок|кирпич|баллон",
+    "упак": r"мешк|мешок|упак",
+    "м": r"(?<![а-я])м(?![а-я0-9²³])|пог|длин",
+}
+
+_MISSING = -1.0
+
+class FormulaTable:
+    """Справочник формул: читается один раз, перечитывается только при изменении файла.
+
+    Строки индексируются по упомянутым в них единицам, чтобы в промпт
+    попадали только правила для нужной пары исходной и целевой единиц.
+    """
+
+    def __init__(self, path=FORMULA_FILE):
+        self.path = path
+        self._mtime = None
+        self.lines = []
+        self._index = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._mtime != _MISSING:
+                logger.error(f"Файл {self.path} не найден!")
+            self._mtime, self.lines, self._index = _MISSING, [], {}
+            return
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [line.rstrip() for line in f if line.strip()]
+        index = {unit: set() for unit in UNIT_MARKERS}
+        for number, line in enumerate(lines):
+            lowered = line.lower()
+            for unit, marker in UNIT_MARKERS.items():
+                if re.search(marker, lowered):
+                    index[unit].add(number)
+        self._mtime, self.lines, self._index = mtime, lines, index
+        logger.info(f"[FORMULA] Справочник {self.path} загружен: {len(lines)} строк")
+
+    def rules_for(self, src, dst) -> str:
+        """Правила промпта и строки справочника для пересчета из src в dst.
+
+        Неизвестная исходная единица — берутся все правила для dst;
+        неизвестная целевая — весь справочник и все правила.
+        """
+        self._refresh()
+        if dst is None:
+            return "\n".join(self.lines + [text for _, _, text in PROMPT_RULES])
+
+        selected = self._index.get(dst, set())
+        if src is not None:
+            selected = selected & self._index.get(src, set())
+        lines = [self.lines[number] for number in sorted(selected)]
+        rules = [text for rule_src, rule_dst, text in PROMPT_RULES if rule_dst == dst and src in (None, rule_src)]
+        return "\n".join(lines + rules)
+
+formula_table = FormulaTable()
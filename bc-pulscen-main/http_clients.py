@@ -0,0 +1,93 @@
+import logging
+import importlib.util
+import aiohttp
+import httpx
+from openai import AsyncOpenAI
+from config import (
+    OPENAI_API_KEY, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 в httpx работает только с установленным пакетом h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class HttpClients:
+    """Общие клиенты исходящих запросов: соединения переиспользуются между вызовами.
+
+    httpx — Perplexity, DaData и быстрые HEAD-проверки; aiohttp — проверка ссылок
+    карточек с кэшем DNS и лимитом соединений на хост; AsyncOpenAI — все вызовы GPT
+    поверх того же пула httpx. Клиенты создаются при старте приложения или воркера,
+    а если код вызван вне них — при первом обращении; после stop() start() открывает
+    их заново.
+    """
+
+    def __init__(self):
+        self._httpx = None
+        self._session = None
+        self._openai = None
+
+    @property
+    def httpx(self) -> httpx.AsyncClient:
+        if self._httpx is None or self._httpx.is_closed:
+            self._httpx = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=30,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._httpx
+
+    @property
+    def openai(self):
+        """Клиент OpenAI поверх общего httpx или None, если OPENAI_API_KEY не задан"""
+        if not OPENAI_API_KEY:
+            return None
+        if self._openai is None or self._openai.is_closed():
+            self._openai = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=self.httpx)
+        return self._openai
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Сессия aiohttp (создается внутри работающего цикла событий)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_MAX_CONNECTIONS,
+                limit_per_host=HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE_EXPIRY,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def start(self):
+        """Открывает пулы соединений (вызывается при старте приложения)"""
+        self.httpx
+        self.openai
+        await self.session()
+        logger.info(
+            f"[HTTP] Клиенты запущены: http2={HTTP2_AVAILABLE}, max_connections={HTTP_MAX_CONNECTIONS}, "
+            f"per_host={HTTP_LIMIT_PER_HOST}, dns_ttl={HTTP_DNS_CACHE_TTL}s"
+        )
+
+    async def stop(self):
+        """Закрывает пулы соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._httpx is not None and not self._httpx.is_closed:
+            await self._httpx.aclose()
+        self._session = self._httpx = self._openai = None
+        logger.info("[HTTP] Клиенты остановлены")
+
+http_clients = HttpClients()
+
+async def is_url_valid(url):
+    """Проверяет валидность URL"""
+    try:
+        response = await http_clients.httpx.head(url, follow_redirects=True, timeout=10)
+        return response.status_code == 200
+    except Exception:
+        return False
@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+import logging
+from config import JOBS_DB_FILE, JOB_STALE_AFTER, JOB_MAX_ATTEMPTS
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+class JobQueue(SqliteStore):
+    """Очередь заданий в SQLite, общая для API и процессов-воркеров"""
+
+    SCHEMA = JOBS_SCHEMA
+
+    def __init__(self, path=JOBS_DB_FILE, stale_after=JOB_STALE_AFTER, max_attempts=JOB_MAX_ATTEMPTS):
+        super().__init__(path)
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+
+    def submit(self, payload: dict) -> str:
+        """Ставит задание в очередь и возвращает его id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        logger.info(f"[JOBS] Задание {job_id} поставлено в очередь")
+        return job_id
+
+    def get(self, job_id: str):
+        """Возвращает задание с результатом или None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self) -> dict:
+        """Количество заданий по статусам"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _recover_stale(self, conn, now):
+        # Задания упавших воркеров возвращаем в очередь, исчерпавшие попытки — в ошибку
+        deadline = now - self.stale_after
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts < ?",
+            (deadline, self.max_attempts)
+        ).rowcount
+        failed = conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Воркер пропал, попытки исчерпаны', finished_at = ? "
+            "WHERE status = 'running' AND heartbeat_at < ?",
+            (now, deadline)
+        ).rowcount
+        if requeued or failed:
+            logger.warning(f"[JOBS] Брошенных заданий: возвращено в очередь {requeued}, завершено с ошибкой {failed}")
+
+    def claim(self, worker_id: str):
+        """Забирает самое старое задание из очереди (атомарно между процессами)"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._recover_stale(conn, now)
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                    "started_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (worker_id, now, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker_id: str):
+        """Отмечает, что воркер все еще обрабатывает задание"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            )
+
+    def complete(self, job_id: str, worker_id: str, result):
+        """Сохраняет результат успешно выполненного задания"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id)
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """Завершает задание с ошибкой"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND worker = ?",
+                (error, time.time(), job_id, worker_id)
+            )
@@ -1,5 +1,8 @@
+import re
 import json
-from pydantic import BaseModel, field_validator
+import difflib
+from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
 
 class ProductQuery(BaseModel):
     name: str
@@ -8,6 +11,7 @@ class ProductQuery(BaseModel):
     number: str
     city: str
     monitor: str
+    refresh_search: bool = False  # Искать в Perplexity заново, не используя кэш карточек
 
     @field_validator('name', 'code', 'weight', 'number', 'city', 'monitor')
     @classmethod
@@ -16,6 +20,10 @@ class ProductQuery(BaseModel):
             raise ValueError('Field cannot be empty')
         return v.strip()
 
+class BatchQuery(BaseModel):
+    rows: List[ProductQuery] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)
+
 def read_cities():
     """Читает файл с городами и их поддоменами"""
     try:
@@ -24,10 +32,130 @@ def read_cities():
     except FileNotFoundError:
         return []
 
+# Сокращения и разговорные названия → название города или региона, как в cities.json
+CITY_ABBREVIATIONS = {
+    "мск": "москва",
+    "спб": "санкт-петербург",
+    "питер": "санкт-петербург",
+    "екб": "екатеринбург",
+    "екат": "екатеринбург",
+    "нск": "новосибирск",
+    "новосиб": "новосибирск",
+    "нн": "нижний новгород",
+    "нижний": "нижний новгород",
+    "ростов": "ростов-на-дону",
+    "мо": "московская область",
+    "подмосковье": "московская область",
+    "ло": "ленинградская область",
+    "башкирия": "башкортостан",
+    "якутия": "саха якутия",
+    "чувашия": "чувашская",
+    "удмуртия": "удмуртская",
+    "хмао": "ханты-мансийский",
+    "югра": "ханты-мансийский",
+    "янао": "ямало-ненецкий",
+    "кбр": "кабардино-балкарская",
+    "алания": "северная осетия",
+}
+
+# Регион → его центр (город из cities.json); без этого регион получал бы первый город файла,
+# например "Московская область" → Балашиха. Ключи — как в place_key
+REGIONAL_CENTERS = {
+    "московская": "Москва",
+    "ленинградская": "Санкт-Петербург",
+    "иркутская": "Иркутск",
+    "мурманская": "Мурманск",
+    "нижегородская": "Нижний Новгород",
+    "краснодарский": "Краснодар",
+    "архангельская": "Архангельск",
+    "красноярский": "Красноярск",
+    "саратовская": "Саратов",
+    "алтайский": "Барнаул",
+    "ростовская": "Ростов-на-Дону",
+    "белгородская": "Белгород",
+    "новосибирская": "Новосибирск",
+    "пермский": "Пермь",
+    "свердловская": "Екатеринбург",
+    "воронежская": "Воронеж",
+    "псковская": "Псков",
+    "приморский": "Владивосток",
+    "владимирская": "Владимир",
+    "волгоградская": "Волгоград",
+    "вологодская": "Вологда",
+    "удмуртская": "Ижевск",
+    "ульяновская": "Ульяновск",
+    "липецкая": "Липецк",
+    "курская": "Курск",
+    "челябинская": "Челябинск",
+    "калужская": "Калуга",
+    "кемеровская": "Кемерово",
+    "крым": "Симферополь",
+    "хабаровский": "Хабаровск",
+    "тамбовская": "Тамбов",
+    "ханты-мансийский": "Ханты-Мансийск",
+    "самарская": "Самара",
+    "тульская": "Тула",
+    "оренбургская": "Оренбург",
+    "ярославская": "Ярославль",
+    "томская": "Томск",
+    "коми": "Сыктывкар",
+    "тюменская": "Тюмень",
+}
+
+# Тип населенного пункта или региона не нужен для сравнения
+PLACE_TYPE_WORDS = r"\b(г|гор|город|обл|область|край|респ|республика|ао|автономный округ|народная)\b\.?"
+
+def normalize_place(name):
+    """Нижний регистр, ё→е, без кавычек, скобок и лишних пробелов"""
+    name = (name or "").casefold().replace("ё", "е")
+    name = re.sub(r"[()«»\"—–]", " ", name)
+    return " ".join(name.replace(" - ", "-").split())
+
+def place_key(name):
+    """Ключ без типа места и второго названия: "Иркутская обл." → "иркутская", "Кемеровская область - Кузбасс" → "кемеровская" """
+    name = re.split(r"\s+[-—–]\s+", name or "")[0]
+    name = normalize_place(name)
+    name = CITY_ABBREVIATIONS.get(name, name)
+    return " ".join(re.sub(PLACE_TYPE_WORDS, " ", name).split())
+
+class CityResolver:
+    """Город или регион → поддомен Pulscen по индексам, построенным один раз из cities.json"""
+
+    def __init__(self, cities=None):
+        self._cities = cities
+        self._exact = None
+        self._keys = None
+
+    def _load(self):
+        exact, keys = {}, {}
+        cities = self._cities if self._cities is not None else read_cities()
+        # Города важнее регионов; регион ведет на свой центр, а если центра нет в файле — на первый город
+        for entry in cities:
+            exact.setdefault(normalize_place(entry["city"]), entry["subdomain"])
+            keys.setdefault(place_key(entry["city"]), entry["subdomain"])
+        for entry in cities:
+            center = REGIONAL_CENTERS.get(place_key(entry["region"]))
+            subdomain = exact.get(normalize_place(center), entry["subdomain"]) if center else entry["subdomain"]
+            exact.setdefault(normalize_place(entry["region"]), subdomain)
+            keys.setdefault(place_key(entry["region"]), subdomain)
+        keys.pop("", None)
+        self._exact, self._keys = exact, keys
+
+    def resolve(self, name, cutoff=0.85):
+        """Поддомен по точному названию, затем по ключу без типа места и сокращениям, затем нечетко"""
+        if self._exact is None:
+            self._load()
+        normalized = normalize_place(name)
+        if normalized in self._exact:
+            return self._exact[normalized]
+        key = place_key(name)
+        if key in self._keys:
+            return self._keys[key]
+        close = difflib.get_close_matches(key, self._keys.keys(), n=1, cutoff=cutoff)
+        return self._keys[close[0]] if close else None
+
+city_resolver = CityResolver()
+
 def pulscen_get_subdomain(region_name):
-    """Получает поддомен для региона"""
-    cities = read_cities()
-    for entry in cities:
-        if entry['region'].lower() == region_name.lower():
-            return entry['subdomain']
-    return None 
\ No newline at end of file
+    """Получает поддомен для города или региона"""
+    return city_resolver.resolve(region_name)
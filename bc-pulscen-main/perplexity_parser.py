@@ -0,0 +1,138 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Метки формата вывода, который задает промпт perplexity_raw_search
+FIELD_LABELS = (
+    ("company", re.compile(r"компания(?:,?\s*продающая\s+товар)?|продавец")),
+    ("name", re.compile(r"товар|название(?:\s+товара)?")),
+    ("price", re.compile(r"цена")),
+    ("address", re.compile(r"адрес")),
+    ("phone", re.compile(r"телефон")),
+    ("url", re.compile(r"ссылка|url")),
+    ("explanation", re.compile(r"пояснение")),
+)
+CARD_FIELDS = ("company", "url", "name", "price", "address", "phone")
+REQUIRED_FIELDS = ("company", "name", "url")
+
+# "1. **Компания, продающая товар:** ООО Ромашка [1]" → метка и значение
+LINE_PATTERN = re.compile(r"^[\s>#*_\-•–—]*(?:\d+[.)]\s*)?[*_]*\s*([а-яёa-z ,]+?)\s*[*_]*\s*:\s*[*_]*\s*(.*)$", re.IGNORECASE)
+CITATION_PATTERN = re.compile(r"\[\d+\]")
+URL_PATTERN = re.compile(r"https?://[^\s\)\]>\"'<]+")
+
+def _field(label: str):
+    label = label.lower().replace("ё", "е").strip(" ,")
+    for field, pattern in FIELD_LABELS:
+        if pattern.fullmatch(label):
+            return field
+    return None
+
+def _clean(field: str, value: str) -> str:
+    value = CITATION_PATTERN.sub("", value)
+    if field == "url":
+        match = URL_PATTERN.search(value)
+        return match.group(0).rstrip(".,;:") if match else ""
+    value = re.sub(r"\*\*|__", "", value).strip(" \t*_")
+    if field == "price" and not re.search(r"\d", value):
+        return ""
+    return value
+
+def parse_line(line: str):
+    """Поле и значение строки вида "Метка: значение" или None, если это не строка формата"""
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None
+    field = _field(match.group(1))
+    if field is None:
+        return None
+    return field, _clean(field, match.group(2))
+
+def is_complete(card: dict) -> bool:
+    return all(card.get(field) for field in REQUIRED_FIELDS)
+
+def to_card(block: dict) -> dict:
+    return {field: block.get(field, "") for field in CARD_FIELDS}
+
+def split_blocks(raw_text: str) -> list:
+    """Разбивает ответ на блоки карточек: новый блок начинается с компании или с повтора уже встреченной метки"""
+    blocks = []
+    current = {}
+    for line in raw_text.splitlines():
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        field, value = parsed
+        if current and (field == "company" or field in current):
+            blocks.append(current)
+            current = {}
+        current[field] = value
+    if current:
+        blocks.append(current)
+    return blocks
+
+def parse_perplexity_cards(raw_text: str, count: int = 3):
+    """Карточки из ответа Perplexity в фиксированном формате без обращения к модели.
+
+    Возвращает None, если формат не распознан: нет ни одной полной карточки
+    (компания, товар, ссылка) или часть блоков не разобралась, а полных меньше count.
+    """
+    blocks = split_blocks(raw_text)
+    cards = [to_card(block) for block in blocks if is_complete(block)]
+    incomplete = len(blocks) - len(cards)
+    if not cards or (incomplete and len(cards) < count):
+        logger.info(f"[PERPLEXITY-PARSE] Формат не распознан: полных блоков {len(cards)}, неполных {incomplete}")
+        return None
+    return cards[:count]
+
+class CardStream:
+    """Разбор ответа по мере поступления: feed() принимает очередной кусок текста
+    и возвращает карточки, блоки которых уже получены целиком.
+
+    Карточка готова, когда в блоке есть все поля карточки или начался следующий блок;
+    строка разбирается только после перевода строки.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current = {}
+        self._emitted = False
+
+    def _emit(self) -> list:
+        self._emitted = True
+        return [to_card(self._current)]
+
+    def _close_block(self) -> list:
+        ready = self._emit() if not self._emitted and is_complete(self._current) else []
+        self._current = {}
+        self._emitted = False
+        return ready
+
+    def _line(self, line: str) -> list:
+        parsed = parse_line(line)
+        if parsed is None:
+            return []
+        field, value = parsed
+        ready = []
+        if self._current and (field == "company" or field in self._current):
+            ready += self._close_block()
+        self._current[field] = value
+        if not self._emitted and is_complete(self._current) and all(f in self._current for f in CARD_FIELDS):
+            ready += self._emit()
+        return ready
+
+    def feed(self, chunk: str) -> list:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        ready = []
+        for line in lines:
+            ready += self._line(line)
+        return ready
+
+    def close(self) -> list:
+        """Дочитывает последнюю строку и последний блок в конце ответа"""
+        ready = self._line(self._buffer) if self._buffer else []
+        self._buffer = ""
+        if self._current:
+            ready += self._close_block()
+        return ready
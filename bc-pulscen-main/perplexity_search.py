@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import aiohttp
+from contextlib import aclosing
+from config import (
+    URL_VALIDATION_DEADLINE, PERPLEXITY_MAX_ATTEMPTS, PERPLEXITY_EXCLUDE_DOMAINS_LIMIT, PERPLEXITY_PARALLEL_SEARCHES,
+    PERPLEXITY_STREAM
+)
+from ai_services import perplexity_search_product_cards, perplexity_stream_product_cards
+from http_clients import http_clients
+from domain_health import domain_health
+from utils import url_domain
+
+logger = logging.getLogger(__name__)
+
+# Функция валидации URL с улучшенной проверкой
+async def validate_url(url: str, timeout: int = 15, retries: int = 3) -> bool:
+    """Проверяет доступность URL с повторными попытками (через общую сессию aiohttp).
+
+    Итог проверки записывается в реестр доменов.
+    """
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    }
+    timeout_config = aiohttp.ClientTimeout(total=timeout, connect=5)
+    domain = url_domain(url)
+    last_error = ""
+    
+    for attempt in range(retries):
+        try:
+            session = await http_clients.session()
+            # SSL не проверяем: у многих сайтов поставщиков просроченные или самоподписанные сертификаты
+            request_options = dict(allow_redirects=True, headers=headers, timeout=timeout_config, ssl=False)
+            # Сначала пробуем HEAD запрос
+            try:
+                async with session.head(url, **request_options) as response:
+                    if 200 <= response.status < 400:
+                        logger.info(f"[URL-VALID] ✅ HEAD {url} → {response.status}")
+                        await asyncio.to_thread(domain_health.record_success, domain)
+                        return True
+                    else:
+                        logger.warning(f"[URL-INVALID] HEAD {url} → {response.status}")
+            except Exception:
+                # Если HEAD не работает, пробуем GET
+                async with session.get(url, **request_options) as response:
+                    if 200 <= response.status < 400:
+                        logger.info(f"[URL-VALID] ✅ GET {url} → {response.status}")
+                        await asyncio.to_thread(domain_health.record_success, domain)
+                        return True
+                    else:
+                        logger.warning(f"[URL-INVALID] GET {url} → {response.status}")
+                        last_error = f"HTTP {response.status}"
+                        
+        except Exception as e:
+            error_msg = str(e) or type(e).__name__
+            last_error = error_msg
+            logger.warning(f"[URL-VALIDATION] Attempt {attempt + 1}/{retries} failed for {url}: {error_msg}")
+            
+            # Быстро отклоняем известные недоступные ошибки
+            if any(err in error_msg for err in [
+                "Name or service not known", 
+                "Connection refused", 
+                "SSL",
+                "certificate",
+                "timeout"
+            ]):
+                logger.warning(f"[URL-INVALID] ❌ Quick reject {url}: {error_msg}")
+                await asyncio.to_thread(domain_health.record_failure, domain, error_msg)
+                return False
+                
+            # Пауза перед повтором только для других ошибок
+            if attempt < retries - 1:
+                await asyncio.sleep(1)
+    
+    logger.warning(f"[URL-INVALID] ❌ All {retries} attempts failed for {url}")
+    await asyncio.to_thread(domain_health.record_failure, domain, last_error or "unavailable")
+    return False
+
+async def validate_urls(urls, deadline=URL_VALIDATION_DEADLINE):
+    """Проверяет ссылки одновременно и отдает пары (url, доступна ли) по мере готовности.
+
+    Ссылки, не проверенные за deadline секунд, считаются недоступными.
+    """
+    async def check(url):
+        return url, await validate_url(url)
+
+    unchecked = list(dict.fromkeys(urls))
+    tasks = [asyncio.create_task(check(url)) for url in unchecked]
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            url, valid = await next_done
+            unchecked.remove(url)
+            yield url, valid
+    except asyncio.TimeoutError:
+        for url in unchecked:
+            logger.warning(f"[URL-INVALID] ❌ Не проверен за {deadline} с: {url}")
+            await asyncio.to_thread(domain_health.record_failure, url_domain(url), f"validation deadline {deadline}s")
+            yield url, False
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _normalize_company(company: str) -> str:
+    return company.replace("«", "\"").replace("»", "\"").strip()
+
+class OfferSearch:
+    """Состояние одного поиска через Perplexity: принятые карточки и исключенные ссылки.
+
+    Попытки (варианты поиска) могут идти одновременно: отбор кандидатов не
+    прерывается await, поэтому одна компания или ссылка не проверяется дважды.
+    """
+
+    def __init__(self, material_name: str, count: int, refresh: bool, stream: bool = False):
+        self.material_name = material_name
+        self.count = count
+        self.refresh = refresh
+        self.stream = stream
+        self.found = asyncio.Event()  # Выставляется, когда набрано count карточек
+        self.results = []
+        self.failed_urls = []  # Список недоступных URL для исключения
+        self.failed_domains = set()  # Набор недоступных доменов
+        self.pending_companies = set()  # Компании и ссылки принятых карточек и проверяемых сейчас
+        self.pending_urls = set()
+
+    @property
+    def done(self) -> bool:
+        return len(self.results) >= self.count
+
+    def exclude_urls(self, dead_domains: list) -> list:
+        """Недоступные в этом поиске ссылки, затем известные реестру мертвые домены"""
+        return self.failed_urls + [
+            domain for domain in dead_domains[:PERPLEXITY_EXCLUDE_DOMAINS_LIMIT]
+            if domain not in self.failed_domains
+        ]
+
+    def select_candidates(self, cards: list, dead_domains: list) -> dict:
+        """Новые уникальные карточки, ссылки которых нужно проверить"""
+        dead_domains = set(dead_domains)
+        candidates = {}
+        for i, item in enumerate(cards):
+            normalized_company = _normalize_company(item["company"])
+            item_domain = url_domain(item["url"])
+            logger.info(f"[PERPLEXITY] Проверяем товар {i+1}: {item['company']} | {item_domain}")
+
+            if item_domain in self.failed_domains:
+                logger.warning(f"[PERPLEXITY] 🚫 Домен {item_domain} уже в списке недоступных, пропускаем")
+            elif item_domain in dead_domains:
+                logger.warning(f"[PERPLEXITY] 🚫 Домен {item_domain} недоступен по истории проверок, пропускаем")
+                self.failed_urls.append(item["url"])
+                self.failed_domains.add(item_domain)
+            elif normalized_company in self.pending_companies:
+                logger.info(f"[PERPLEXITY] 🔄 Пропуск дубля компании: {normalized_company}")
+            elif item["url"] in self.pending_urls:
+                logger.info(f"[PERPLEXITY] 🔄 Пропуск дубля URL: {item['url']}")
+            else:
+                self.pending_companies.add(normalized_company)
+                self.pending_urls.add(item["url"])
+                candidates[item["url"]] = item
+        return candidates
+
+    def accept(self, item: dict, url_valid: bool):
+        """Учитывает результат проверки ссылки карточки"""
+        url = item["url"]
+        if not url_valid:
+            logger.warning(f"[PERPLEXITY] ❌ URL недоступен, пропускаем: {url} | {item['company']}")
+            self.failed_urls.append(url)
+            self.failed_domains.add(url_domain(url))
+            self.pending_companies.discard(_normalize_company(item["company"]))
+            self.pending_urls.discard(url)
+            logger.info(f"[PERPLEXITY] 📝 Добавлен недоступный домен: {url_domain(url)} (всего исключений: {len(self.failed_domains)})")
+        elif not self.done:
+            self.results.append(item)
+            logger.info(f"[PERPLEXITY] ✅ Найден валидный товар {len(self.results)}/{self.count}: {item['company']} | {item['name']}")
+            if self.done:
+                self.found.set()
+
+    async def check(self, item: dict):
+        """Проверяет ссылку одной карточки, не дольше URL_VALIDATION_DEADLINE"""
+        try:
+            url_valid = await asyncio.wait_for(validate_url(item["url"]), URL_VALIDATION_DEADLINE)
+        except asyncio.TimeoutError:
+            logger.warning(f"[URL-INVALID] ❌ Не проверен за {URL_VALIDATION_DEADLINE} с: {item['url']}")
+            await asyncio.to_thread(
+                domain_health.record_failure, url_domain(item["url"]), f"validation deadline {URL_VALIDATION_DEADLINE}s"
+            )
+            url_valid = False
+        self.accept(item, url_valid)
+
+    async def run_attempt(self, attempt: int, max_attempts: int):
+        """Один вариант поиска: запрос к Perplexity и одновременная проверка ссылок"""
+        logger.info(f"[PERPLEXITY] Попытка {attempt}/{max_attempts}: поиск товаров через Perplexity")
+        logger.info(f"[PERPLEXITY] Текущий прогресс: {len(self.results)}/{self.count} товаров найдено")
+        # Недоступные по истории домены читаются из реестра один раз на попытку
+        dead_domains = await asyncio.to_thread(domain_health.dead_domains)
+        if self.stream:
+            await self.run_stream_attempt(attempt, dead_domains)
+            return
+        cards = await perplexity_search_product_cards(
+            self.material_name, count=self.count, attempt=attempt, exclude_urls=self.exclude_urls(dead_domains),
+            refresh=self.refresh
+        )
+        logger.info(f"[PERPLEXITY] Получено {len(cards)} результатов от Perplexity на попытке {attempt}")
+        if self.done:
+            return
+        candidates = self.select_candidates(cards, dead_domains)
+
+        # Все ссылки попытки проверяются одновременно, результаты учитываются по мере готовности
+        async with aclosing(validate_urls(candidates)) as checks:
+            async for url, url_valid in checks:
+                self.accept(candidates[url], url_valid)
+                if self.done:
+                    logger.info(f"[PERPLEXITY] ⏹️ Уже найдено {self.count} товара, остальные проверки отменяются")
+                    break
+
+        if not self.done:
+            logger.warning(f"[PERPLEXITY] Попытка {attempt}: найдено только {len(self.results)} валидных товаров из {self.count}")
+            logger.info(f"[PERPLEXITY] Исключенных доменов: {len(self.failed_domains)}, исключенных URL: {len(self.failed_urls)}")
+
+    async def run_stream_attempt(self, attempt: int, dead_domains: list):
+        """Вариант поиска с потоковым ответом: каждая карточка проверяется, пока ответ еще приходит"""
+        checks = set()
+        try:
+            async with aclosing(perplexity_stream_product_cards(
+                self.material_name, count=self.count, attempt=attempt, exclude_urls=self.exclude_urls(dead_domains),
+                refresh=self.refresh
+            )) as cards:
+                async for card in cards:
+                    for item in self.select_candidates([card], dead_domains).values():
+                        checks.add(asyncio.create_task(self.check(item)))
+                    if self.done:
+                        break
+            logger.info(f"[PERPLEXITY] Ответ на попытке {attempt} получен, ждем проверки ссылок: {sum(not c.done() for c in checks)}")
+            if checks:
+                await asyncio.gather(*checks)
+        finally:
+            for task in checks:
+                task.cancel()
+            await asyncio.gather(*checks, return_exceptions=True)
+
+        if not self.done:
+            logger.warning(f"[PERPLEXITY] Попытка {attempt}: найдено только {len(self.results)} валидных товаров из {self.count}")
+            logger.info(f"[PERPLEXITY] Исключенных доменов: {len(self.failed_domains)}, исключенных URL: {len(self.failed_urls)}")
+
+async def search_perplexity_offers(material_name: str, count: int = 3, max_attempts: int = PERPLEXITY_MAX_ATTEMPTS,
+                                   refresh: bool = False, parallel: int = PERPLEXITY_PARALLEL_SEARCHES,
+                                   stream: bool = PERPLEXITY_STREAM) -> list:
+    """Ищет через Perplexity count карточек разных компаний с доступными ссылками.
+
+    Каждая попытка — новый вариант поиска; недоступные ссылки и их домены
+    исключаются из следующих попыток. Домены, которые реестр считает недоступными,
+    отбрасываются без проверки и тоже передаются Perplexity как исключения.
+    При parallel > 1 одновременно идут до parallel попыток (всего не больше
+    max_attempts), а оставшиеся отменяются, как только набрано count карточек.
+    При stream=True ответ Perplexity читается потоком и ссылки карточек
+    проверяются, не дожидаясь конца ответа.
+    """
+    search = OfferSearch(material_name, count, refresh, stream)
+    attempts = 0
+    running = set()
+    found = asyncio.create_task(search.found.wait())
+
+    logger.info(
+        f"[PERPLEXITY-START] Начинаем поиск с максимум {max_attempts} попытками "
+        f"(одновременно до {parallel}) для получения {count} товаров"
+    )
+    try:
+        while not search.done and (attempts < max_attempts or running):
+            while not search.done and attempts < max_attempts and len(running) < parallel:
+                attempts += 1
+                running.add(asyncio.create_task(search.run_attempt(attempts, max_attempts)))
+            # Ждем конца любой попытки или нужного числа карточек, даже если попытки еще идут
+            finished, _ = await asyncio.wait(running | {found}, return_when=asyncio.FIRST_COMPLETED)
+            finished.discard(found)
+            running -= finished
+            for task in finished:
+                if task.exception() is not None:
+                    if parallel == 1:
+                        raise task.exception()
+                    logger.error(f"[PERPLEXITY] Ошибка попытки поиска: {task.exception()}")
+    finally:
+        found.cancel()
+        if running:
+            logger.info(f"[PERPLEXITY] ⏹️ Отменяем незавершенных попыток: {len(running)}")
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    if not search.done:
+        logger.error(f"[PERPLEXITY] После {attempts} попыток найдено только {len(search.results)} товаров")
+    return search.results
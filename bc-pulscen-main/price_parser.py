@@ -0,0 +1,94 @@
+import re
+import logging
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
+
+# Единицы приводятся к одному обозначению; ключ — запись без пробелов и точек
+UNIT_ALIASES = {
+    "т": "т", "тн": "т", "тонна": "т", "тонну": "т", "тонн": "т",
+    "кг": "кг", "килограмм": "кг",
+    "шт": "шт", "штука": "шт", "штуку": "шт", "ед": "шт", "лист": "шт", "рулон": "шт", "баллон": "шт",
+    "канистра": "шт", "ведро": "шт", "бочка": "шт",
+    "упак": "упак", "уп": "упак", "упаковка": "упак", "мешок": "упак", "меш": "упак",
+    "м2": "м2", "м²": "м2", "квм": "м2",
+    "м3": "м3", "м³": "м3", "кубм": "м3", "куб": "м3",
+    "л": "л", "литр": "л",
+    "м": "м", "погм": "м", "пм": "м", "мп": "м",
+}
+
+CURRENCY_ALIASES = (
+    ("₽", "RUB"), ("руб", "RUB"), ("р.", "RUB"), ("rub", "RUB"),
+    ("$", "USD"), ("usd", "USD"), ("€", "EUR"), ("eur", "EUR"),
+)
+
+# Число с разделителями тысяч: "1 200", "12 500,50", "1200.5"
+NUMBER_PATTERN = r"\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+# Диапазон проверяется только с первого числа строки: "от 100 руб./шт. (партия 1-5 шт)" — цена 100, а не 1-5
+RANGE_PATTERN = re.compile(rf"({NUMBER_PATTERN})\s*(?:до|-|–|—)\s*({NUMBER_PATTERN})")
+SINGLE_PATTERN = re.compile(NUMBER_PATTERN)
+# Единица после "/" или "за": "м2", "м³", "кв.м", "куб. м"; количество "1" перед ней пропускается ("руб/ 1 шт")
+UNIT_PATTERN = re.compile(r"(?:/|\bза\s)\s*(?:1\s*(?![\d.,]))?([а-яa-z]+[²³23]?(?:\.\s*[а-я]+[²³23]?)?)")
+PACK_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*(кг|тн|т|л|м2|м²|м3|м³|м)(?![а-я0-9²³])")
+
+def to_decimal(text):
+    """Число из строки с пробелами-разделителями тысяч и запятой, или None"""
+    try:
+        return Decimal(re.sub(r"[ \u00a0\u202f]", "", text).replace(",", "."))
+    except (InvalidOperation, TypeError):
+        return None
+
+def normalize_unit(text):
+    """Приводит единицу измерения ("м³", "кв.м", "тонна", "мешок") к каноническому обозначению или None"""
+    compact = re.sub(r"[\s.]", "", (text or "").lower().replace("ё", "е"))
+    if compact in UNIT_ALIASES:
+        return UNIT_ALIASES[compact]
+    words = (text or "").lower().split()
+    return UNIT_ALIASES.get(re.sub(r"[.]", "", words[0])) if words else None
+
+def parse_price(price: str, currency: str = None):
+    """Разбирает строку цены Pulscen или Perplexity.
+
+    "1 200", "от 1 200 до 1 500" + "руб./шт.", "260 руб./мешок 30 кг" → словарь
+    {"min", "max" (Decimal), "currency" ("RUB"...), "unit" (как в normalize_unit),
+    "pack_size" (Decimal), "pack_unit"}. Если числа в цене нет — None.
+    """
+    text = f"{price or ''} {currency or ''}".lower().replace("ё", "е")
+
+    # Цена — первое число строки ("от" перед ним ничего не меняет), диапазон — только если он начинается с него
+    first = SINGLE_PATTERN.search(text)
+    if not first:
+        return None
+    match = RANGE_PATTERN.match(text, first.start())
+    if match:
+        low, high = to_decimal(match.group(1)), to_decimal(match.group(2))
+    else:
+        match = first
+        low = high = to_decimal(first.group(0))
+    # Единица и фасовка ищутся сразу после цены, а не в остальном тексте
+    tail = text[match.end():]
+    if low is None:
+        return None
+    if high is not None and high < low:
+        low, high = high, low
+
+    unit = None
+    unit_match = UNIT_PATTERN.search(tail)
+    if unit_match and not re.search(r"\d", tail[:unit_match.start()]):
+        unit = normalize_unit(unit_match.group(1))
+        tail = tail[unit_match.end():]
+
+    pack_size = pack_unit = None
+    pack_match = PACK_PATTERN.search(tail)
+    if pack_match:
+        pack_size = to_decimal(pack_match.group(1))
+        pack_unit = normalize_unit(pack_match.group(2))
+
+    return {
+        "min": low,
+        "max": high,
+        "currency": next((code for alias, code in CURRENCY_ALIASES if alias in text), None),
+        "unit": unit,
+        "pack_size": pack_size,
+        "pack_unit": pack_unit,
+    }
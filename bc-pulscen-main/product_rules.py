@@ -0,0 +1,90 @@
+import re
+import logging
+from utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Сокращения и синонимы приводятся к одному написанию до сравнения
+SYNONYMS = {
+    "х/ц": "хризотилцементный",
+    "хц": "хризотилцементный",
+    "а/ц": "хризотилцементный",
+    "асбестоцементный": "хризотилцементный",
+    "асбестоцементные": "хризотилцементный",
+    "асбестоцементная": "хризотилцементный",
+    "шифер": "лист",
+    "лпп": "лист плоский прессованный",
+    "лпн": "лист плоский непрессованный",
+    "плоски": "плоский",
+}
+
+# Карточки услуг, а не товаров (сравнение по началу слова)
+SERVICE_STEMS = ("услуг", "аренд", "освидетельствован", "проверк", "диагностик", "монтаж", "доставк")
+
+# Взаимоисключающие признаки: если в запросе один, а в карточке другой — это разные товары
+OPPOSITE_ATTRIBUTES = (
+    ("непрессован", "прессован"),
+    ("волнист", "плоск"),
+)
+
+ENDINGS = ("ыми", "ими", "ого", "его", "ому", "ему", "ые", "ие", "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ых", "их", "ы", "и", "а", "я")
+
+THICKNESS_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*мм')
+DIMENSIONS_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*[хx*]\s*(\d+(?:[.,]\d+)?)(?:\s*[хx*]\s*(\d+(?:[.,]\d+)?))?')
+
+def _stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+def canonical_tokens(text):
+    """Нормализует название, раскрывает сокращения и отбрасывает окончания"""
+    words = []
+    for word in normalize_text(text).split():
+        words.extend(SYNONYMS.get(word, word).split())
+    return [_stem(SYNONYMS.get(word, word)) for word in words]
+
+def extract_thickness(text):
+    """Все числа, которые могут быть толщиной в мм: "8 мм", а также размеры "8х1200х3000" """
+    text = normalize_text(text)
+    values = {m.group(1) for m in THICKNESS_PATTERN.finditer(text)}
+    for m in DIMENSIONS_PATTERN.finditer(text):
+        values.update(group for group in m.groups() if group)
+    return {float(value.replace(',', '.')) for value in values}
+
+def _attribute(tokens, variants):
+    # Варианты проверяются по порядку, чтобы "непрессован" не засчитывался как "прессован"
+    for variant in variants:
+        if any(token.startswith(variant) for token in tokens):
+            return variant
+    return None
+
+def check_product_rules(query_name, product_name):
+    """Локальная проверка карточки по механическим правилам.
+
+    Возвращает "нет" при явном несовпадении, "да" при совпадении названий
+    с точностью до синонимов и порядка слов, None — если решать должна модель.
+    """
+    query_tokens = canonical_tokens(query_name)
+    product_tokens = canonical_tokens(product_name)
+
+    for stem in SERVICE_STEMS:
+        if any(t.startswith(stem) for t in product_tokens) and not any(t.startswith(stem) for t in query_tokens):
+            return "нет"
+
+    for variants in OPPOSITE_ATTRIBUTES:
+        query_value = _attribute(query_tokens, variants)
+        product_value = _attribute(product_tokens, variants)
+        if query_value and product_value and query_value != product_value:
+            return "нет"
+
+    query_thickness = {float(v.replace(',', '.')) for v in THICKNESS_PATTERN.findall(normalize_text(query_name))}
+    if query_thickness:
+        product_thickness = extract_thickness(product_name)
+        if product_thickness and not query_thickness & product_thickness:
+            return "нет"
+
+    if query_tokens and sorted(query_tokens) == sorted(product_tokens):
+        return "да"
+    return None
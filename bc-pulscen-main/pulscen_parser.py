@@ -0,0 +1,233 @@
+import re
+import logging
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Все поля карточек выдачи собираются в браузере одним проходом по DOM
+LISTING_CARDS_JS = """() => Array.from(document.querySelectorAll('article.product-listing__item-wrapper')).map(article => {
+    const text = (selector) => {
+        const el = article.querySelector(selector);
+        return el ? el.textContent : null;
+    };
+    const nameElem = article.querySelector('a.product-listing__product-name');
+    return {
+        name: nameElem ? nameElem.textContent : null,
+        href: nameElem ? nameElem.getAttribute('href') : null,
+        company: text('span.product-listing__company-name-wrapper'),
+        price_discount: text('i[data-price-type="discount-new"]'),
+        price_exact: text('i[data-price-type="exact"]'),
+        price_from: text('span[data-price-type="from"]'),
+        price_to: text('span[data-price-type="to"]'),
+        currency: text('span.price-currency'),
+        address: text('div.product-listing__address')
+    };
+})"""
+
+def build_listing_card(raw: dict) -> dict:
+    """Приводит сырые поля карточки выдачи к виду, который использует поиск"""
+    name = raw.get("name")
+    product_name = name if name is not None else "не указано"
+    href = raw.get("href") or ""
+    link = f"https://www.pulscen.ru{href}" if href and not href.startswith("http") else href
+
+    company_raw = raw.get("company")
+    company = (company_raw if company_raw is not None else "не указано").replace('\n', ' ').strip()
+    if "г." in company:
+        company = company.split("г.")[0].strip()
+
+    if raw.get("price_discount") is not None:
+        price = raw["price_discount"]
+    elif raw.get("price_exact") is not None:
+        price = raw["price_exact"]
+    elif raw.get("price_from") is not None and raw.get("price_to") is not None:
+        price = f"от {raw['price_from']} до {raw['price_to']}"
+    elif raw.get("price_from") is not None:
+        price = f"от {raw['price_from']}"
+    else:
+        price = ""
+
+    currency = raw.get("currency")
+    address = raw.get("address")
+    return {
+        "name": product_name,
+        "link": link,
+        "company": company,
+        "price": price,
+        "currency": currency if currency is not None else "руб.",
+        "address": address if address is not None else ""
+    }
+
+async def extract_listing_cards(page) -> list:
+    """Извлекает все карточки страницы поиска Pulscen за один вызов page.evaluate"""
+    raw_cards = await page.evaluate(LISTING_CARDS_JS)
+    return [build_listing_card(raw) for raw in raw_cards]
+
+# Все поля страницы товара собираются в браузере одним проходом по DOM
+PRODUCT_PAGE_JS = """() => {
+    const innerText = (root, selector) => {
+        const el = root.querySelector(selector);
+        return el ? el.innerText : null;
+    };
+    const characteristics = [];
+    const charBlock = document.querySelector('div.product-tabber__body.js-product-tabber-content');
+    if (charBlock) {
+        for (const item of charBlock.querySelectorAll('div.product-description-list__item')) {
+            const labelElem = item.querySelector('span.product-description-list__label');
+            const valueElem = item.querySelector('span.product-description-list__value');
+            if (!labelElem || !valueElem) continue;
+            let values = Array.from(valueElem.querySelectorAll('a, span'))
+                .map(node => node.innerText.trim())
+                .filter(Boolean);
+            if (!values.length) values = [valueElem.innerText.trim()];
+            characteristics.push([labelElem.innerText.trim(), values.join(', ')]);
+        }
+    }
+    const descrBlock = document.querySelector('div.product-tabber__body.js-product-tabber-content#tab-description div.product-description.js-apb-descr');
+    const sellerLink = document.querySelector('a.js-ykr-action');
+    return {
+        has_char_block: Boolean(charBlock),
+        characteristics: characteristics,
+        description: descrBlock
+            ? Array.from(descrBlock.querySelectorAll('p')).map(p => p.innerText.trim()).filter(Boolean)
+            : null,
+        delivery: innerText(document, 'div.product-deliveries__name'),
+        footer_address: innerText(document, 'div.footer-bottom__address'),
+        header_phone: innerText(document, 'div.header-phone__number'),
+        seller_site: sellerLink ? sellerLink.getAttribute('href') : null
+    };
+}"""
+
+def build_product_page(raw: dict) -> dict:
+    """Приводит сырые поля страницы товара к виду, который использует обработка карточки"""
+    characteristics = dict(raw.get("characteristics") or [])
+    if raw.get("description") is not None:
+        description = ' '.join(raw["description"])
+        words = description.split()
+        if len(words) > 70:
+            description = ' '.join(words[:70]) + '...'
+        characteristics['Описание'] = description
+    return {
+        "has_char_block": bool(raw.get("has_char_block")),
+        "characteristics": characteristics,
+        "delivery_method": (raw.get("delivery") or "").replace('\n', ' ').strip(),
+        "footer_address": raw.get("footer_address") or "",
+        "header_phone": raw.get("header_phone") or "",
+        "seller_site": raw.get("seller_site") or ""
+    }
+
+async def extract_product_page(page) -> dict:
+    """Извлекает характеристики, описание, доставку, адрес и ссылку продавца за один page.evaluate"""
+    raw = await page.evaluate(PRODUCT_PAGE_JS)
+    return build_product_page(raw)
+
+# Разбор сохраненной страницы товара без браузера: те же селекторы, что в PRODUCT_PAGE_JS,
+# поэтому результат build_product_page можно проверить на HTML-фикстуре
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+class _Element:
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.id = attrs.get("id") or ""
+        self.classes = set((attrs.get("class") or "").split())
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+
+    def descendants(self):
+        for child in self.children:
+            if isinstance(child, _Element):
+                yield child
+                yield from child.descendants()
+
+    def text(self) -> str:
+        """Текст элемента со схлопнутыми пробелами (как innerText для строчной разметки)"""
+        parts = [child if isinstance(child, str) else child.text() for child in self.children]
+        return re.sub(r"\s+", " ", "".join(parts)).strip()
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = self.current = _Element("#document", {})
+
+    def handle_starttag(self, tag, attrs):
+        element = _Element(tag, dict(attrs), self.current)
+        self.current.children.append(element)
+        if tag not in VOID_TAGS:
+            self.current = element
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+def _compound(selector: str) -> tuple:
+    """'div.a.b#id' → (тег, классы, id)"""
+    tag = re.match(r"[a-z0-9]*", selector).group(0)
+    return tag, set(re.findall(r"\.([\w-]+)", selector)), next(iter(re.findall(r"#([\w-]+)", selector)), "")
+
+def _matches_compound(element, compound) -> bool:
+    tag, classes, element_id = compound
+    return (not tag or element.tag == tag) and classes <= element.classes and (not element_id or element.id == element_id)
+
+def _matches(element, chain) -> bool:
+    # Селектор из частей через пробел: последняя часть — сам элемент, остальные — его предки
+    if not _matches_compound(element, chain[-1]):
+        return False
+    ancestor = element.parent
+    for compound in reversed(chain[:-1]):
+        while ancestor is not None and not _matches_compound(ancestor, compound):
+            ancestor = ancestor.parent
+        if ancestor is None:
+            return False
+        ancestor = ancestor.parent
+    return True
+
+def _select_all(root, selector: str) -> list:
+    """Аналог querySelectorAll для тегов, классов, id, потомков и списка через запятую"""
+    chains = [[_compound(part) for part in alternative.split()] for alternative in selector.split(",")]
+    return [element for element in root.descendants() if any(_matches(element, chain) for chain in chains)]
+
+def _select(root, selector: str):
+    found = _select_all(root, selector)
+    return found[0] if found else None
+
+def _text(root, selector: str):
+    element = _select(root, selector)
+    return element.text() if element is not None else None
+
+def product_page_from_html(html: str) -> dict:
+    """Сырые поля страницы товара из HTML — то же, что PRODUCT_PAGE_JS, но без браузера"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    document = builder.root
+
+    characteristics = []
+    char_block = _select(document, 'div.product-tabber__body.js-product-tabber-content')
+    if char_block is not None:
+        for item in _select_all(char_block, 'div.product-description-list__item'):
+            label_elem = _select(item, 'span.product-description-list__label')
+            value_elem = _select(item, 'span.product-description-list__value')
+            if label_elem is None or value_elem is None:
+                continue
+            values = [node.text() for node in _select_all(value_elem, 'a, span') if node.text()]
+            if not values:
+                values = [value_elem.text()]
+            characteristics.append([label_elem.text(), ', '.join(values)])
+    descr_block = _select(document, 'div.product-tabber__body.js-product-tabber-content#tab-description div.product-description.js-apb-descr')
+    seller_link = _select(document, 'a.js-ykr-action')
+    return {
+        "has_char_block": char_block is not None,
+        "characteristics": characteristics,
+        "description": [p.text() for p in _select_all(descr_block, 'p') if p.text()] if descr_block is not None else None,
+        "delivery": _text(document, 'div.product-deliveries__name'),
+        "footer_address": _text(document, 'div.footer-bottom__address'),
+        "header_phone": _text(document, 'div.header-phone__number'),
+        "seller_site": seller_link.attrs.get("href") if seller_link is not None else None
+    }
@@ -0,0 +1,52 @@
+import os
+from pulscen_parser import product_page_from_html, build_product_page
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pulscen_product_page.html")
+
+def load_fixture() -> dict:
+    with open(FIXTURE, encoding="utf-8") as f:
+        return build_product_page(product_page_from_html(f.read()))
+
+def test_product_page_characteristics():
+    # Значения, которые давал прежний поэлементный разбор на фикстуре
+    characteristics = load_fixture()["characteristics"]
+    description = characteristics.pop("Описание")
+    assert characteristics == {
+        "Материал": "хризотилцемент",
+        "Тип": "лист плоский",
+        "Способ изготовления": "прессованный",
+        "Толщина": "8 мм",
+        "Длина": "3000 мм",
+        "Ширина": "1500 мм",
+        "Масса": "70 кг",
+        "ГОСТ": "ГОСТ 18124-2012",
+        "Цвет": "серый, натуральный",
+        "Производитель": "Белгородский асбестоцементный комбинат",
+        "Страна": "Россия",
+        "Применение": "кровля, облицовка, перегородки",
+        "Упаковка": "пачка 50 шт.",
+        "Минимальная партия": "10 листов",
+        "Наличие": "в наличии",
+    }
+    assert description.startswith("Плоский прессованный хризотилцементный лист ЛПП 8х1500х3000 мм. Абзац 1:")
+    assert description.endswith("...")
+    assert len(description[:-3].split()) == 70
+
+def test_product_page_seller_fields():
+    page = load_fixture()
+    assert page["has_char_block"]
+    assert page["delivery_method"] == "Самовывоз, доставка по Москве"
+    assert page["footer_address"].startswith("ООО «СтройПример», г. Москва, ул. Складская, д. 12")
+    assert page["header_phone"] == "8 (800) 555-35-35"
+    assert page["seller_site"] == "https://stroy-example.ru/catalog/list-lpp-8"
+
+def test_product_page_without_blocks():
+    page = build_product_page(product_page_from_html("<html><body><p>Нет данных</p></body></html>"))
+    assert page == {
+        "has_char_block": False,
+        "characteristics": {},
+        "delivery_method": "",
+        "footer_address": "",
+        "header_phone": "",
+        "seller_site": "",
+    }
@@ -0,0 +1,60 @@
+import os
+import asyncio
+import logging
+from PIL import Image, ImageDraw, ImageFont
+from config import SCREENSHOT_MODE
+from utils import get_current_date
+
+logger = logging.getLogger(__name__)
+
+FONT_PATH = 'dejavu-fonts-ttf-2.37/ttf/DejaVuSans.ttf'
+BANNER_HEIGHT = 40
+
+# pyautogui снимает весь экран, поэтому параллельные страницы снимаются по очереди
+screen_lock = asyncio.Lock()
+
+def _load_font(size):
+    if os.path.exists(FONT_PATH):
+        return ImageFont.truetype(FONT_PATH, size)
+    logger.warning(f"Шрифт {FONT_PATH} не найден, используем стандартный")
+    return ImageFont.load_default()
+
+def draw_banner(path, url, timestamp):
+    """Добавляет над скриншотом строку адреса и время, как на снимке рабочего стола"""
+    image = Image.open(path).convert("RGB")
+    width, height = image.size
+    canvas = Image.new("RGB", (width, height + BANNER_HEIGHT), (222, 225, 230))
+    canvas.paste(image, (0, BANNER_HEIGHT))
+
+    draw = ImageDraw.Draw(canvas)
+    font = _load_font(16)
+    time_width = draw.textlength(timestamp, font=font)
+    bar_right = width - time_width - 30
+    draw.rounded_rectangle((10, 6, bar_right, BANNER_HEIGHT - 6), radius=14, fill=(255, 255, 255))
+    max_url_width = bar_right - 38
+    if draw.textlength(url, font=font) > max_url_width:
+        while url and draw.textlength(url + "…", font=font) > max_url_width:
+            url = url[:-1]
+        url += "…"
+    draw.text((24, BANNER_HEIGHT / 2), url, fill=(32, 33, 36), font=font, anchor="lm")
+    draw.text((width - 12, BANNER_HEIGHT / 2), timestamp, fill=(32, 33, 36), font=font, anchor="rm")
+    canvas.save(path)
+
+async def _capture_page(page, path):
+    await page.screenshot(path=path)
+    await asyncio.to_thread(draw_banner, path, page.url, get_current_date())
+
+async def _capture_screen(page, path):
+    import pyautogui
+    async with screen_lock:
+        await page.bring_to_front()
+        await asyncio.sleep(0.5)
+        screenshot = pyautogui.screenshot()
+        await asyncio.to_thread(screenshot.save, path)
+
+async def capture_page(page, path, mode=SCREENSHOT_MODE):
+    """Сохраняет скриншот видимой части страницы выбранным способом (playwright или pyautogui)"""
+    if mode == "pyautogui":
+        await _capture_screen(page, path)
+    else:
+        await _capture_page(page, path)
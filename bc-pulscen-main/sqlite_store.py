@@ -0,0 +1,28 @@
+import sqlite3
+from contextlib import contextmanager
+
+class SqliteStore:
+    """Основа хранилищ в SQLite (кэш, очередь заданий, реестр доменов).
+
+    Файл общий для API и процессов-воркеров: база переводится в режим WAL, чтобы
+    чтения не ждали записи, а схема подкласса (SCHEMA) создается при первом запуске.
+    Соединение открывается на каждую операцию, поэтому методы можно вызывать из
+    потоков через asyncio.to_thread.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
@@ -1,38 +1,74 @@
-import os
 import re
+import time
+import asyncio
 import logging
-import httpx
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from config import COMPANIES_FILE, FORMULA_FILE
 
 logger = logging.getLogger(__name__)
 
-def read_formula_table():
-    """Читает таблицу формул"""
-    try:
-        with open(FORMULA_FILE, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        logger.error(f"Файл {FORMULA_FILE} не найден!")
-        return ""
-
-def read_comp_table():
-    """Читает таблицу компаний"""
-    if os.path.exists(COMPANIES_FILE):
-        with open(COMPANIES_FILE, "r", encoding="utf-8") as f:
-            return f.read()
-    return ""
-
-async def is_url_valid(url):
-    """Проверяет валидность URL"""
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.head(url, follow_redirects=True)
-            return response.status_code == 200
-    except Exception:
+def url_domain(url: str) -> str:
+    """Домен из ссылки ("https://site.ru/item/1" → "site.ru"); строка без схемы возвращается как есть"""
+    return url.split('/')[2] if url.startswith('http') else url
+
+class AsyncRateLimiter:
+    """Пропускает не больше rate вызовов в секунду, лишние ждут своей очереди"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def is_valid_inn(inn):
+    """Проверяет ИНН по длине и контрольным цифрам (10 цифр — организация, 12 — ИП)"""
+    inn = str(inn or "")
+    if not inn.isdigit() or len(inn) not in (10, 12):
         return False
 
+    def check_digit(digits, weights):
+        return sum(int(d) * w for d, w in zip(digits, weights)) % 11 % 10
+
+    if len(inn) == 10:
+        return check_digit(inn, (2, 4, 10, 3, 5, 9, 4, 6, 8)) == int(inn[9])
+    return (check_digit(inn, (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)) == int(inn[10])
+            and check_digit(inn, (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)) == int(inn[11]))
+
+def normalize_text(text):
+    """Приводит строку к виду для сравнения: нижний регистр, ё→е, без знаков препинания и лишних пробелов"""
+    text = (text or "").lower().replace("ё", "е")
+    text = re.sub(r'[^\w/.,]+', ' ', text)
+    text = re.sub(r'(?<!\d)[.,]|[.,](?!\d)', ' ', text)
+    return ' '.join(text.split())
+
+PHONE_PATTERN = r'(?:\+7|8|7)[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{2}[\s\-\(\)]*\d{2}'
+
+def find_phone_number(text):
+    """Находит первый номер телефона в тексте и приводит его к виду +7XXXXXXXXXX"""
+    matches = re.findall(PHONE_PATTERN, text or "")
+    if not matches:
+        return None
+    cleaned = re.sub(r'[^\d+]', '', matches[0])
+    if len(cleaned) == 11 and cleaned.startswith('8'):
+        return f"+7{cleaned[1:]}"
+    return cleaned
+
+EMAIL_PATTERN = r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}'
+# Имена файлов вида logo@2x.png тоже похожи на адрес почты
+EMAIL_FILE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+
+def find_email(text):
+    """Находит первый адрес электронной почты в тексте"""
+    for match in re.findall(EMAIL_PATTERN, text or ""):
+        if not match.lower().endswith(EMAIL_FILE_SUFFIXES):
+            return match
+    return None
+
 async def extract_phone_number(page):
     """Извлекает номер телефона со страницы"""
     phone_number = "Номер на сайте отсутствует"
@@ -41,47 +77,21 @@ async def extract_phone_number(page):
         # Пытаемся найти блок с адресом и телефоном
         address_block = await page.query_selector('div.footer-bottom__address')
         if address_block:
-            text = await address_block.inner_text()
-            matches = re.findall(r'(?:\+7|8|7)[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{2}[\s\-\(\)]*\d{2}', text)
-            if matches:
-                raw = matches[0]
-                cleaned = re.sub(r'[^\d+]', '', raw)
-                if len(cleaned) == 11 and cleaned.startswith('8'):
-                    phone_number = f"+7{cleaned[1:]}"
-                elif len(cleaned) == 12 and cleaned.startswith('+7'):
-                    phone_number = cleaned
-                else:
-                    phone_number = cleaned
-                return phone_number
+            found = find_phone_number(await address_block.inner_text())
+            if found:
+                return found
 
         # Если не нашли в footer, ищем в header
         header_phone = await page.query_selector('div.header-phone__number')
         if header_phone:
-            text = await header_phone.inner_text()
-            matches = re.findall(r'(?:\+7|8|7)[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{2}[\s\-\(\)]*\d{2}', text)
-            if matches:
-                raw = matches[0]
-                cleaned = re.sub(r'[^\d+]', '', raw)
-                if len(cleaned) == 11 and cleaned.startswith('8'):
-                    phone_number = f"+7{cleaned[1:]}"
-                elif len(cleaned) == 12 and cleaned.startswith('+7'):
-                    phone_number = cleaned
-                else:
-                    phone_number = cleaned
-                return phone_number
+            found = find_phone_number(await header_phone.inner_text())
+            if found:
+                return found
 
         # Если не нашли в конкретных блоках, ищем по всей странице
-        page_text = await page.content()
-        matches = re.findall(r'(?:\+7|8|7)[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{3}[\s\-\(\)]*\d{2}[\s\-\(\)]*\d{2}', page_text)
-        if matches:
-            raw = matches[0]
-            cleaned = re.sub(r'[^\d+]', '', raw)
-            if len(cleaned) == 11 and cleaned.startswith('8'):
-                phone_number = f"+7{cleaned[1:]}"
-            elif len(cleaned) == 12 and cleaned.startswith('+7'):
-                phone_number = cleaned
-            else:
-                phone_number = cleaned
+        found = find_phone_number(await page.content())
+        if found:
+            phone_number = found
 
     except Exception as e:
         logger.warning(f"Ошибка извлечения номера: {str(e)}")
@@ -0,0 +1,77 @@
+import os
+import socket
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from fastapi import HTTPException
+from config import JOB_WORKERS, JOB_POLL_INTERVAL, JOB_HEARTBEAT_INTERVAL
+from job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+async def heartbeat_loop(queue: JobQueue, job_id: str, worker_id: str):
+    """Периодически отмечает задание, чтобы его не сочли брошенным"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        await asyncio.to_thread(queue.heartbeat, job_id, worker_id)
+
+async def run_worker(worker_id: str):
+    """Забирает задания из очереди и прогоняет их через основной конвейер"""
+    # Импорт здесь: main настраивает логирование и клиентов уже внутри процесса воркера
+    from main import collect_offers
+    from models import ProductQuery
+    from browser_pool import browser_pool
+    from http_clients import http_clients
+
+    queue = JobQueue()
+    await browser_pool.start()
+    await http_clients.start()
+    logger.info(f"[WORKER {worker_id}] Запущен")
+    try:
+        while True:
+            job = await asyncio.to_thread(queue.claim, worker_id)
+            if job is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            logger.info(f"[WORKER {worker_id}] Задание {job['id']} (попытка {job['attempts']}): {job['payload']}")
+            heartbeat = asyncio.create_task(heartbeat_loop(queue, job["id"], worker_id))
+            try:
+                response = await collect_offers(ProductQuery(**job["payload"]))
+                await asyncio.to_thread(queue.complete, job["id"], worker_id, response)
+                logger.info(f"[WORKER {worker_id}] Задание {job['id']} выполнено")
+            except HTTPException as e:
+                await asyncio.to_thread(queue.fail, job["id"], worker_id, str(e.detail))
+                logger.error(f"[WORKER {worker_id}] Задание {job['id']} завершено с ошибкой: {e.detail}")
+            except Exception as e:
+                await asyncio.to_thread(queue.fail, job["id"], worker_id, str(e))
+                logger.exception(f"[WORKER {worker_id}] Задание {job['id']} завершено с ошибкой: {e}")
+            finally:
+                heartbeat.cancel()
+    finally:
+        await http_clients.stop()
+        await browser_pool.stop()
+
+def worker_process():
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        asyncio.run(run_worker(worker_id))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркеры очереди заданий /jobs")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Количество процессов-воркеров")
+    args = parser.parse_args()
+
+    processes = [multiprocessing.Process(target=worker_process, name=f"worker-{i + 1}") for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    print(f"Запущено воркеров: {len(processes)}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()